@@ -0,0 +1,73 @@
+"""
+Measures the memory retained by the downstream elements of a hub model, compared to the API payloads they are built
+ from, which the report objects used to keep alive.
+
+Usage:
+    python benchmarks/memory_benchmark.py --elements 50000
+"""
+import argparse
+import json
+import os
+import sys
+import tracemalloc
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from mock_server import SyntheticGraph, guid  # noqa: E402
+
+from dataobjects import DownstreamElement  # noqa: E402
+
+
+def build_payloads(elements: int) -> list[dict]:
+    # decoded from JSON, like the API responses, so no string is shared between the payloads
+    return [
+        json.loads(json.dumps(SyntheticGraph.element(guid("el", number))))
+        for number in range(elements)
+    ]
+
+
+def measure(elements: int) -> dict:
+    """
+    Measure the memory of the payloads alone, then of the elements built from them once the payloads are released
+    :param elements: the number of downstream elements
+    :return: the results, in bytes
+    """
+    tracemalloc.start()
+
+    payloads = build_payloads(elements)
+    payloads_memory, _ = tracemalloc.get_traced_memory()
+    del payloads
+
+    tracemalloc.reset_peak()
+    payloads = build_payloads(elements)
+    downstream_elements = [DownstreamElement(payload) for payload in payloads]
+    del payloads
+    elements_memory, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "elements": len(downstream_elements),
+        "payloads_bytes": payloads_memory,
+        "elements_bytes": elements_memory,
+        "peak_bytes": peak_memory,
+        "payload_bytes_per_element": round(payloads_memory / elements),
+        "bytes_per_element": round(elements_memory / elements),
+        # the payloads were kept alive next to the elements before
+        "reduction": round(
+            1 - elements_memory / (payloads_memory + elements_memory), 3
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--elements", type=int, default=50000)
+    args = parser.parse_args()
+
+    print(json.dumps(measure(elements=args.elements)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,475 @@
+"""
+Local stand-in for the Select Star and GitHub APIs, serving a synthetic lineage graph.
+"""
+import gzip
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DATA_SOURCE_TYPES = ["dbt", "snowflake", "looker", "tableau", "mode"]
+OBJECT_TYPES = ["table", "view", "dashboard", "explore", "workbook"]
+# GitHub rejects longer comments
+COMMENT_MAX_CHARS = 65536
+# attributes of the full Select Star objects that the action doesn't read, returned without a `query` projection
+DETAIL_ATTRIBUTES = {
+    "description": "Synthetic object of the benchmark lineage graph, with a description of a realistic length.",
+    "richtext_description": None,
+    "external_id": None,
+    "created_on": "2024-01-01T00:00:00Z",
+    "updated_on": "2024-06-01T00:00:00Z",
+    "last_queried": "2024-06-01T00:00:00Z",
+    "deactivation_scheduled_on": None,
+    "is_hidden": False,
+    "breadcrumbs": [
+        {
+            "guid": "db_000000000001",
+            "name": "analytics",
+            "target_data_type": "database",
+        },
+        {"guid": "sch_000000000001", "name": "bench", "target_data_type": "schema"},
+    ],
+    "tagged_items": [],
+    "data_source": {
+        "guid": "ds_000000000001",
+        "name": "warehouse",
+        "type": "snowflake",
+    },
+}
+
+
+def parse_query(query: str) -> dict:
+    """
+    Parse a `query` projection, e.g. "{guid,database{name}}" -> {"guid": {}, "database": {"name": {}}}
+    """
+    fields = [{}]
+    name = ""
+    for char in query:
+        if char.isalnum() or char == "_":
+            name += char
+            continue
+        if name:
+            fields[-1][name] = {}
+        if char == "{" and name:
+            fields.append(fields[-1][name])
+        elif char == "}" and len(fields) > 1:
+            fields.pop()
+        name = ""
+    return fields[0]
+
+
+def project(data, fields: dict):
+    """
+    Keep only the given fields of an object or of every object of a list
+    """
+    if isinstance(data, list):
+        return [project(item, fields) for item in data]
+    if not fields or not isinstance(data, dict):
+        return data
+    return {
+        name: project(data[name], sub_fields)
+        for name, sub_fields in fields.items()
+        if name in data
+    }
+
+
+def guid(prefix: str, number: int) -> str:
+    return f"{prefix}_{number:012d}"
+
+
+def guid_number(value: str) -> int:
+    return int(value.split("_")[-1])
+
+
+class SyntheticGraph:
+    """
+    Deterministic lineage graph: every changed model has a warehouse table, and both have `fan_out` downstream
+     elements picked from a shared pool, so models overlap like on a real project.
+    """
+
+    def __init__(self, models: int, fan_out: int, overlap: float = 0.5, seed: int = 0):
+        self.models = models
+        self.fan_out = fan_out
+        self.pool_size = max(int(models * fan_out * (1 - overlap)), fan_out, 1)
+        self.seed = seed
+
+    def model_path(self, number: int) -> str:
+        return f"models/bench/group_{number % 10}/model_{number}.sql"
+
+    def changed_files(self) -> list[dict]:
+        return [
+            {
+                "filename": f"dbt_project/{self.model_path(number)}",
+                "status": "modified",
+                "sha": f"{number:040x}",
+                # a single output column changed, for the column-level mode
+                "patch": "@@ -2,4 +2,4 @@ select\n     id,\n"
+                f"-    amount as total_{number % 5},\n"
+                f"+    amount * 2 as total_{number % 5},\n"
+                "     created_at",
+            }
+            for number in range(self.models)
+        ]
+
+    def write_manifest(self, filepath: str, other_nodes: int = 0):
+        """
+        Write a dbt manifest.json with a node for every changed model, after `other_nodes` unchanged ones
+        """
+        with open(filepath, "w") as manifest_file:
+            manifest_file.write('{"metadata": {"dbt_version": "1.7.0"}, "nodes": {')
+            for number in range(-other_nodes, self.models):
+                name = f"model_{abs(number)}" if number >= 0 else f"other_{-number}"
+                node = {
+                    "resource_type": "model",
+                    "name": name,
+                    "database": "analytics",
+                    "schema": "bench",
+                    "alias": name,
+                    "original_file_path": f"models/bench/{name}.sql"
+                    if number < 0
+                    else self.model_path(number),
+                    "raw_code": "select 1 as id" * 50,
+                }
+                separator = "," if number > -other_nodes else ""
+                manifest_file.write(
+                    f'{separator}"model.bench.{name}": {json.dumps(node)}'
+                )
+            manifest_file.write("}}")
+
+    def downstream(self, source_guid: str) -> list[dict]:
+        """
+        The direct downstream of any object of the graph, including the object itself like the real API
+        """
+        number = guid_number(source_guid)
+        if source_guid.startswith(("tbl_", "wh_")):
+            fan_out = self.fan_out
+        elif source_guid.startswith("col_"):
+            # a column only reaches a part of the downstream of its table
+            fan_out = max(self.fan_out // 10, 1)
+        else:
+            # downstream elements have a much smaller fan-out, keeping multi-hop walks bounded
+            fan_out = number % 4
+        rng = random.Random(f"{self.seed}-{source_guid}")
+        elements = [self.element(source_guid)]
+        for _ in range(fan_out):
+            elements.append(self.element(guid("el", rng.randrange(self.pool_size))))
+        return elements
+
+    def batch_downstream(self, source_guids: list[str]) -> list[dict]:
+        """
+        The combined direct downstream of several objects, in the order of each object's own lineage, every
+         element with the requested objects it is a downstream of
+        """
+        return [
+            element | {"source_guids": [source_guid]}
+            for source_guid in source_guids
+            for element in self.downstream(source_guid)
+        ]
+
+    @staticmethod
+    def element(element_guid: str) -> dict:
+        number = guid_number(element_guid)
+        data_source_type = DATA_SOURCE_TYPES[number % len(DATA_SOURCE_TYPES)]
+        linked_objs = []
+        if data_source_type == "dbt":
+            linked_objs = [guid("el", number + 1)]
+        elif data_source_type == "snowflake":
+            linked_objs = [guid("el", number - 1)]
+        return {
+            "guid": element_guid,
+            "name": f"object_{number}",
+            "full_name": f"db.schema.object_{number}",
+            "data_type": OBJECT_TYPES[number % len(OBJECT_TYPES)],
+            "data_source_type": data_source_type,
+            "linked_objs": linked_objs,
+            "popularity": {
+                "popularity": number % 100,
+                "query_count": (number * 7) % 1000,
+                "user_count": number % 30,
+            },
+        }
+
+    @staticmethod
+    def table(table_guid: str) -> dict:
+        number = guid_number(table_guid)
+        return {
+            "guid": table_guid,
+            "name": f"table_{number}",
+            "data_type": "table",
+            "database": {
+                "guid": "db_000000000001",
+                "name": "analytics",
+                "data_source": {
+                    "guid": "ds_000000000001",
+                    "name": "warehouse",
+                    "type": "snowflake",
+                },
+            },
+            "schema": {"guid": "sch_000000000001", "name": "bench"},
+        }
+
+
+class MockServer:
+    """
+    Threaded HTTP server answering the Select Star and GitHub endpoints used by the action.
+    """
+
+    def __init__(
+        self,
+        graph: SyntheticGraph,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        per_page_cap: int = 100,
+        lineage_batches: bool = True,
+        projection: bool = True,
+        compression: bool = True,
+    ):
+        self.graph = graph
+        self.latency = latency
+        self.error_rate = error_rate
+        self.per_page_cap = per_page_cap
+        # without it the multi-GUID lineage endpoint answers 404, like an older API
+        self.lineage_batches = lineage_batches
+        # without them the `query` projection is ignored and the responses are never compressed
+        self.projection = projection
+        self.compression = compression
+        self.comments: dict[int, dict] = {}
+        self.requests = 0
+        # the conditional requests answered with a 304, as the resource didn't change
+        self.not_modified = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(graph.seed)
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self.__build_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def __enter__(self) -> "MockServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __build_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.handle(self, "GET")
+
+            def do_POST(self):
+                server.handle(self, "POST")
+
+            def do_PATCH(self):
+                server.handle(self, "PATCH")
+
+        return Handler
+
+    def handle(self, handler: BaseHTTPRequestHandler, method: str):
+        with self._lock:
+            self.requests += 1
+            # the comment POST and PATCH calls are never retried, like on the real APIs they would fail the run
+            fail = method == "GET" and self._rng.random() < self.error_rate
+
+        body = None
+        length = int(handler.headers.get("Content-Length") or 0)
+        if length:
+            body = json.loads(handler.rfile.read(length))
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if fail:
+            return self.respond(handler, 503, {"detail": "injected error"})
+
+        parsed_url = urlparse(handler.path)
+        params = {key: values[0] for key, values in parse_qs(parsed_url.query).items()}
+        segments = parsed_url.path.strip("/").split("/")
+
+        try:
+            status, data, headers = self.route(method, segments, params, body)
+        except (KeyError, ValueError, IndexError):
+            status, data, headers = 404, {"detail": "not found"}, {}
+
+        self.respond(handler, status, data, headers)
+
+    def serialize(self, objects: list[dict], params: dict) -> list[dict]:
+        """
+        The given Select Star objects, projected on the requested fields or as full objects
+        """
+        if self.projection and "query" in params:
+            return project(objects, parse_query(params["query"]))
+        return [DETAIL_ATTRIBUTES | data for data in objects]
+
+    def route(
+        self, method: str, segments: list[str], params: dict, body: dict | None
+    ) -> tuple[int, dict | list, dict]:
+        # Select Star
+        if segments[:2] == ["v1", "tables"] and len(segments) == 2:
+            return 200, self.tables(params), {}
+        if segments[:3] == ["v1", "dbt", "warehouse-link"]:
+            model_number = guid_number(segments[3])
+            link = {
+                "guid": guid("lnk", model_number),
+                "dbt_table": self.graph.table(guid("tbl", model_number)),
+                "warehouse_table": self.graph.table(guid("wh", model_number)),
+            }
+            return 200, {"results": self.serialize([link], params)}, {}
+        if segments == ["v1", "lineage"] and self.lineage_batches:
+            return (
+                200,
+                {
+                    "table_lineage": self.serialize(
+                        self.graph.batch_downstream(params["guids"].split(",")), params
+                    )
+                },
+                {},
+            )
+        if segments[:2] == ["v1", "lineage"]:
+            return (
+                200,
+                {
+                    f"{params.get('mode', 'table')}_lineage": self.serialize(
+                        self.graph.downstream(segments[2]), params
+                    )
+                },
+                {},
+            )
+        if segments[:2] == ["v1", "columns"]:
+            return 200, self.columns(params), {}
+
+        # GitHub
+        if segments == ["user"]:
+            return 200, {"login": "benchmark"}, {}
+        if segments[0] == "repos" and segments[3] == "pulls" and segments[5] == "files":
+            return self.paginate(segments, params, self.graph.changed_files())
+        if segments[0] == "repos" and segments[3] == "issues":
+            return self.comments_endpoint(method, segments, params, body)
+
+        raise KeyError(segments)
+
+    def tables(self, params: dict) -> dict:
+        if "full_names" in params:
+            results = [
+                {"guid": guid("tbl", guid_number(full_name)), "full_name": full_name}
+                for full_name in params["full_names"].split(",")
+            ]
+        elif "guids" in params:
+            results = self.serialize(
+                [
+                    self.graph.table(table_guid)
+                    for table_guid in params["guids"].split(",")
+                ],
+                params,
+            )
+        else:
+            results = []
+            for path in params["filenames"].split(","):
+                number = int(path.rsplit("_", 1)[-1].split(".")[0])
+                results.append(
+                    {
+                        "guid": guid("tbl", number),
+                        "extra": {"path": f"dbt_project/{path}"},
+                        "table_type": "table",
+                    }
+                )
+        return {"count": len(results), "results": results}
+
+    def columns(self, params: dict) -> dict:
+        table_number = guid_number(params["tables"])
+        results = [
+            {
+                "guid": guid(
+                    "col", table_number * 1000 + zlib.crc32(name.encode()) % 1000
+                ),
+                "name": name,
+            }
+            for name in params["names"].split(",")
+        ]
+        return {"count": len(results), "results": results}
+
+    def paginate(
+        self, segments: list[str], params: dict, items: list
+    ) -> tuple[int, list, dict]:
+        per_page = min(int(params.get("per_page", 30)), self.per_page_cap)
+        page = int(params.get("page", 1))
+        last_page = max((len(items) + per_page - 1) // per_page, 1)
+        base_url = f"{self.url}/{'/'.join(segments)}?per_page={per_page}"
+        links = []
+        if page < last_page:
+            links.append(f'<{base_url}&page={page + 1}>; rel="next"')
+            links.append(f'<{base_url}&page={last_page}>; rel="last"')
+        headers = {"Link": ", ".join(links)} if links else {}
+        return 200, items[(page - 1) * per_page : page * per_page], headers
+
+    def comments_endpoint(
+        self, method: str, segments: list[str], params: dict, body: dict | None
+    ) -> tuple[int, dict | list, dict]:
+        if body and len(body["body"]) > COMMENT_MAX_CHARS:
+            return (
+                422,
+                {"message": "Body is too long (maximum is 65536 characters)"},
+                {},
+            )
+        with self._lock:
+            if segments[4] == "comments":
+                comment_id = int(segments[5])
+                comment = self.comments[comment_id]
+                if method == "PATCH":
+                    comment["body"] = body["body"]
+                return 200, comment, {}
+            if method == "POST":
+                comment_id = len(self.comments) + 1
+                self.comments[comment_id] = {
+                    "id": comment_id,
+                    "html_url": f"{self.url}/comments/{comment_id}",
+                    "body": body["body"],
+                    "user": {"login": "benchmark"},
+                }
+                return 201, self.comments[comment_id], {}
+            return self.paginate(segments, params, list(self.comments.values()))
+
+    def respond(
+        self,
+        handler: BaseHTTPRequestHandler,
+        status: int,
+        data: dict | list,
+        headers: dict | None = None,
+    ):
+        content = json.dumps(data).encode()
+        etag = None
+        if handler.command == "GET" and status == 200:
+            etag = f'"{zlib.crc32(content):08x}"'
+            if handler.headers.get("If-None-Match") == etag:
+                with self._lock:
+                    self.not_modified += 1
+                handler.send_response(304)
+                handler.send_header("ETag", etag)
+                handler.end_headers()
+                return
+
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        if etag:
+            handler.send_header("ETag", etag)
+        if self.compression and "gzip" in handler.headers.get("Accept-Encoding", ""):
+            content = gzip.compress(content, compresslevel=6)
+            handler.send_header("Content-Encoding", "gzip")
+        handler.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(content)
@@ -0,0 +1,215 @@
+"""
+Runs the whole impact report pipeline against the local stand-in APIs and reports its wall time, request counts
+ and peak memory.
+
+Usage:
+    python benchmarks/run_benchmark.py --models 150 --fan-out 100 --latency 0.05
+    python benchmarks/run_benchmark.py --scenario large --output results.json
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from mock_server import MockServer, SyntheticGraph  # noqa: E402
+
+import app  # noqa: E402
+from metrics import metrics  # noqa: E402
+from settings import SettingsManager  # noqa: E402
+
+SCENARIOS = {
+    "small": {"models": 10, "fan_out": 1},
+    "medium": {"models": 150, "fan_out": 100},
+    "large": {"models": 1000, "fan_out": 1000},
+    "huge": {"models": 5000, "fan_out": 100},
+    "hub": {"models": 10, "fan_out": 10000},
+    # too many models for a comment even without tables, the last ones are left out
+    "cut": {"models": 1000, "fan_out": 1},
+}
+
+
+def run_scenario(
+    models: int,
+    fan_out: int,
+    latency: float,
+    error_rate: float,
+    extra_settings: dict[str, str],
+    manifest_nodes: int | None = None,
+    lineage_batches: bool = True,
+    projection: bool = True,
+    compression: bool = True,
+    runs: int = 1,
+) -> dict:
+    """
+    Runs the pipeline once against a new stand-in server
+    :param manifest_nodes: when set, the models are read from a dbt manifest with this many other nodes
+    :param lineage_batches: whether the stand-in server answers the multi-GUID lineage requests
+    :param projection: whether the stand-in server applies the `query` projection of the Select Star requests
+    :param compression: whether the stand-in server compresses its responses
+    :param runs: the number of runs against the same server, only the last one is measured, e.g. to measure the
+     runs reading the caches of a previous one
+    :return: the scenario results
+    """
+    graph = SyntheticGraph(models=models, fan_out=fan_out)
+    temporary_dir = tempfile.TemporaryDirectory()
+    if manifest_nodes is not None:
+        manifest_filepath = os.path.join(temporary_dir.name, "manifest.json")
+        graph.write_manifest(manifest_filepath, other_nodes=manifest_nodes)
+        extra_settings = extra_settings | {"DBT_MANIFEST_PATH": manifest_filepath}
+
+    with temporary_dir, MockServer(
+        graph=graph,
+        latency=latency,
+        error_rate=error_rate,
+        lineage_batches=lineage_batches,
+        projection=projection,
+        compression=compression,
+    ) as server:
+        environ = {
+            "GIT_PROVIDER": "github",
+            "GIT_CI": "False",
+            "GIT_API_URL": server.url,
+            "GIT_REPOSITORY": "benchmark/repository",
+            "GIT_REPOSITORY_TOKEN": "benchmark",
+            "PULL_REQUEST_ID": "1",
+            "SELECTSTAR_API_URL": server.url,
+            "SELECTSTAR_WEB_URL": "https://app.selectstar.com",
+            "SELECTSTAR_API_TOKEN": "benchmark",
+            "SELECTSTAR_DATASOURCE_GUID": "ds_000000000001",
+            "HTTP_BACKOFF_FACTOR": "0.01",
+        } | extra_settings
+        os.environ.update(environ)
+        os.environ.pop("GITHUB_STEP_SUMMARY", None)
+        os.environ.pop("GITHUB_WORKSPACE", None)
+        settings = SettingsManager().get_settings()
+
+        for _ in range(runs - 1):
+            app.run(settings=settings)
+        server_requests = server.requests
+        not_modified = server.not_modified
+
+        metrics.reset()
+        tracemalloc.start()
+        start = time.perf_counter()
+        app.run(settings=settings)
+        wall_time = time.perf_counter() - start
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        summary = metrics.summary()
+        report = next(iter(server.comments.values()))["body"]
+        if "Select Star Impact Report" not in report:
+            raise RuntimeError(f"The posted comment isn't a report: {report[:200]}")
+
+        return {
+            "models": models,
+            "fan_out": fan_out,
+            "latency": latency,
+            "error_rate": error_rate,
+            "settings": extra_settings,
+            "wall_time": round(wall_time, 3),
+            "requests": summary["requests"],
+            "server_requests": server.requests - server_requests,
+            "not_modified": server.not_modified - not_modified,
+            "bytes": summary["bytes"],
+            "decoded_bytes": summary["decoded_bytes"],
+            "peak_memory_mb": round(peak_memory / 1024 / 1024, 2),
+            "report_chars": len(report),
+            "stages": summary["stages"],
+            "endpoints": {
+                name: endpoint["requests"]
+                for name, endpoint in summary["endpoints"].items()
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), action="append")
+    parser.add_argument("--models", type=int, default=150)
+    parser.add_argument("--fan-out", type=int, default=100)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds added to each response"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="ratio of 503 responses to the GET requests",
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="SETTING=VALUE",
+        help="extra action setting, e.g. --set SELECTSTAR_MAX_CONCURRENCY=1",
+    )
+    parser.add_argument(
+        "--manifest-nodes",
+        type=int,
+        help="read the models from a dbt manifest with this many unchanged nodes",
+    )
+    parser.add_argument(
+        "--no-lineage-batches",
+        action="store_true",
+        help="answer the multi-GUID lineage requests with a 404, like an API without them",
+    )
+    parser.add_argument(
+        "--no-projection",
+        action="store_true",
+        help="return full objects whatever the requested fields, like an API without the `query` projection",
+    )
+    parser.add_argument(
+        "--no-compression",
+        action="store_true",
+        help="never compress the responses",
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=1,
+        help="run the pipeline this many times against the same server and measure the last run,"
+        " e.g. --runs 2 --set CACHE_DIR=/tmp/cache to measure a run with warm caches",
+    )
+    parser.add_argument("--output", help="JSON file receiving the results")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.ERROR)
+
+    extra_settings = dict(setting.split("=", 1) for setting in args.set)
+    scenarios = [SCENARIOS[name] for name in args.scenario or []] or [
+        {"models": args.models, "fan_out": args.fan_out}
+    ]
+
+    results = []
+    for scenario in scenarios:
+        result = run_scenario(
+            latency=args.latency,
+            error_rate=args.error_rate,
+            extra_settings=extra_settings,
+            manifest_nodes=args.manifest_nodes,
+            lineage_batches=not args.no_lineage_batches,
+            projection=not args.no_projection,
+            compression=not args.no_compression,
+            runs=args.runs,
+            **scenario,
+        )
+        print(json.dumps(result))
+        results.append(result)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
 import logging
 
 from git import GitProvider
+from manifest import DbtManifest
+from metrics import metrics
 from report_printer import ReportPrinter
+from report_state import ReportState
+from scoring import score_models
 from selectstar import SelectStar
 from settings import AppSettings, SettingsManager
 
@@ -10,13 +14,11 @@ logging.basicConfig(format=FORMAT, level=logging.INFO)
 log = logging.getLogger(__name__)
 
 
-if __name__ == "__main__":
-    log.info("Starting Dbt Impact Report by Select Star.")
-
-    settings_manager = SettingsManager()
-    settings = settings_manager.get_settings()
-    settings_manager.print()
-
+def run(settings: dict) -> None:
+    """
+    Creates or updates the impact report of the pull request described by the settings
+    :param settings: the app settings
+    """
     git_provider = GitProvider(settings.get(AppSettings.GIT_PROVIDER))
 
     log.info(f"Is this a CI execution? {settings.get(AppSettings.GIT_CI)}")
@@ -24,18 +26,77 @@ if __name__ == "__main__":
     log.info("Getting the list of changed models using GIT API.")
 
     git = git_provider.get_git_integration(settings)
-    dbt_models = git.get_changed_files()
+    with metrics.stage("get_changed_files"):
+        dbt_models = git.get_changed_files()
+
+    manifest = DbtManifest.from_settings(settings)
+    if manifest:
+        log.info("Reading the changed models from the dbt manifest.")
+        with metrics.stage("read_manifest"):
+            manifest.resolve_models(dbt_models=dbt_models)
+
+    report_state = None
+    models_to_fetch = dbt_models
+    if settings.get(AppSettings.REPORT_INCREMENTAL):
+        log.info("Restoring the unchanged models from the previous impact report.")
+        report_state = ReportState(settings=settings)
+        with metrics.stage("restore_report_state"):
+            previous_comment = git.get_impact_report_comment()
+            report_state.load(previous_comment["body"] if previous_comment else None)
+            models_to_fetch = report_state.restore(dbt_models=dbt_models)
 
     log.info("Getting the lineage for each dbt model.")
 
-    selectstar = SelectStar(settings=settings)
-    selectstar.get_lineage(dbt_models=dbt_models)
+    SelectStar.get_lineage_by_datasource(settings=settings, dbt_models=models_to_fetch)
+
+    shared_downstream = None
+    if settings.get(AppSettings.REPORT_SHARED_DOWNSTREAM):
+        log.info("Aggregating the downstream objects shared by the models.")
+        with metrics.stage("get_shared_downstream"):
+            shared_downstream = SelectStar.get_shared_downstream(dbt_models=dbt_models)
+
+    log.info("Scoring the impact of the downstream objects.")
+    with metrics.stage("score_impact"):
+        score_models(dbt_models=dbt_models)
+
+    state = None
+    if report_state:
+        report_state.update(dbt_models=dbt_models)
+        state = report_state.print()
 
     log.info("Creating the report.")
 
     printer = ReportPrinter(settings=settings)
-    impact_report_body = printer.print(models=dbt_models)
+    with metrics.stage("print_report"):
+        impact_report_body = printer.print(
+            models=dbt_models,
+            shared_downstream=shared_downstream,
+            max_chars=git.get_report_max_chars(state=state),
+            spill_note=bool(printer.get_step_summary_filepath()),
+        )
+        if printer.truncated:
+            log.warning(
+                "The report is too long for a comment, only the downstream objects with the highest impact are listed."
+            )
+            printer.write_step_summary(
+                models=dbt_models, shared_downstream=shared_downstream
+            )
+
+    with metrics.stage("insert_or_update_impact_report"):
+        git.insert_or_update_impact_report(body=impact_report_body, state=state)
+    git.close()
+
+    metrics.log()
+    metrics.write(filepath=settings.get(AppSettings.METRICS_FILE))
+
+
+if __name__ == "__main__":
+    log.info("Starting Dbt Impact Report by Select Star.")
+
+    settings_manager = SettingsManager()
+    settings = settings_manager.get_settings()
+    settings_manager.print()
 
-    comment_id = git.insert_or_update_impact_report(body=impact_report_body)
+    run(settings=settings)
 
     log.info("Dbt Impact Report has ended, bye!")
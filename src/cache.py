@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from metrics import metrics
+from settings import AppSettings
+
+log = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Persistent cache of API responses stored in a single SQLite file.
+    Entries expire after a TTL and the least recently used ones are evicted when the cache grows over its size limit.
+    """
+
+    filename = "selectstar-impact-report-cache.sqlite3"
+
+    def __init__(self, directory: str, ttl: int, max_entries: int, refresh: bool):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.refresh = refresh
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self.filepath = os.path.join(directory, self.filename)
+        self._connection = sqlite3.connect(self.filepath, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL"
+            ")"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)"
+        )
+        self.__evict()
+
+    @classmethod
+    def from_settings(cls, settings: dict) -> "ResponseCache | None":
+        """
+        Creates the cache described by the settings
+        :param settings: the app settings
+        :return: the cache, or None when no cache directory is set
+        """
+        directory = settings.get(AppSettings.CACHE_DIR)
+        if not directory:
+            return None
+
+        log.info(f"Using the response cache at {directory=}")
+
+        return cls(
+            directory=directory,
+            ttl=settings.get(AppSettings.CACHE_TTL),
+            max_entries=settings.get(AppSettings.CACHE_MAX_ENTRIES),
+            refresh=settings.get(AppSettings.CACHE_REFRESH),
+        )
+
+    @staticmethod
+    def build_key(endpoint: str, guid: str, params: dict | None = None) -> str:
+        """
+        Builds the key of a cache entry
+        :param endpoint: the endpoint name, e.g. "lineage"
+        :param guid: the guid of the requested object
+        :param params: the query parameters of the request
+        :return: the cache key
+        """
+        return json.dumps([endpoint, guid, params or {}], sort_keys=True)
+
+    def get(self, key: str) -> dict | list | None:
+        """
+        Get a cached value
+        :param key: the cache key
+        :return: the cached value, or None when it is missing, expired or a refresh was requested
+        """
+        if self.refresh:
+            metrics.record_cache_lookup(hit=False)
+            return None
+
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM entries WHERE key = ? AND created_at > ?",
+                (key, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                metrics.record_cache_lookup(hit=False)
+                return None
+            self._connection.execute(
+                "UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        metrics.record_cache_lookup(hit=True)
+
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(self, key: str, value: dict | list):
+        """
+        Store a value in the cache
+        :param key: the cache key
+        :param value: a JSON serializable value
+        """
+        compressed_value = zlib.compress(
+            json.dumps(value, separators=(",", ":")).encode()
+        )
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, compressed_value, now, now),
+            )
+
+    def close(self):
+        """
+        Evict the expired and least recently used entries, then save the cache file
+        """
+        self.__evict()
+        self._connection.close()
+
+    def __evict(self):
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM entries WHERE created_at <= ?", (time.time() - self.ttl,)
+            )
+            self._connection.execute(
+                "DELETE FROM entries WHERE key NOT IN"
+                " (SELECT key FROM entries ORDER BY accessed_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self._connection.commit()
+
+
+class RevalidationCache(ResponseCache):
+    """
+    Persistent cache of the git provider responses, stored with their ETag and revalidated on every request.
+    It has its own file, so the git interface keeps it open without locking the Select Star response cache.
+    """
+
+    filename = "selectstar-impact-report-git-cache.sqlite3"
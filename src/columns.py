@@ -0,0 +1,67 @@
+import re
+
+# a changed line starting with one of these isn't part of a select list, it may change every output column
+CLAUSE_PATTERN = re.compile(
+    r"^(?:(?:from|where|join|left|right|inner|full|cross|on|using|group|order|having|qualify|limit|union"
+    r"|intersect|except|with|window|when|then|else|end)\b|\)|\{\{|\{%)",
+    flags=re.IGNORECASE,
+)
+# the output column of a select list item: its alias, or the last part of a column reference
+ALIAS_PATTERN = re.compile(r"\bas\s+[\"`]?(\w+)[\"`]?$", flags=re.IGNORECASE)
+COLUMN_PATTERN = re.compile(r"^(?:[\"`]?\w+[\"`]?\.)*[\"`]?(\w+)[\"`]?$")
+SELECT_PATTERN = re.compile(r"^select(\s+distinct)?\b", flags=re.IGNORECASE)
+
+
+def parse_changed_line(line: str) -> str | None:
+    """
+    Find the output column of a changed line of a dbt model, e.g. "  amount * 2 as total," -> "total"
+    :param line: the line content, without the diff marker
+    :return: the lowercase column name, "" when the line has no code, or None when the line isn't a select list item
+    """
+    code = line.split("--", 1)[0].strip().strip(",").strip()
+    if not code:
+        return ""
+
+    select = SELECT_PATTERN.match(code)
+    if select:
+        code = code[select.end() :].strip()
+        if not code:
+            return ""
+    if CLAUSE_PATTERN.match(code):
+        return None
+
+    found_alias = ALIAS_PATTERN.search(code)
+    if found_alias:
+        return found_alias.group(1).lower()
+
+    # the first line of a multi-line case expression
+    found_column = COLUMN_PATTERN.match(code)
+    if not found_column or found_column.group(1).lower() == "case":
+        return None
+
+    return found_column.group(1).lower()
+
+
+def parse_changed_columns(patch: str | None) -> frozenset[str] | None:
+    """
+    Find the output columns touched by the patch of a dbt model, from its added and removed lines.
+    This is a line-based heuristic: as soon as a changed line is not a simple select list item, e.g. a join, a filter,
+     a macro or an expression spanning several lines, the change may affect every column.
+    :param patch: the unified diff of the model file, as the `patch` field of the pull request files API
+    :return: the lowercase names of the touched columns, or None when the lineage must be table-level
+    """
+    if not patch:
+        return None
+
+    columns = set()
+    for line in patch.splitlines():
+        if not line.startswith(("+", "-")) or line.startswith(("+++", "---")):
+            continue
+
+        column = parse_changed_line(line[1:])
+        if column is None:
+            return None
+        if column:
+            columns.add(column)
+
+    return frozenset(columns)
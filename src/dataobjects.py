@@ -1,71 +1,154 @@
+import sys
 from json import JSONEncoder
 
 
+def intern(value: str | None) -> str | None:
+    """
+    Intern the given string, so the few distinct values of an attribute are shared by every object
+    """
+    return sys.intern(value) if isinstance(value, str) else value
+
+
 class ReportObjectEncoder(JSONEncoder):
     def default(self, o):
-        return o.__dict__
+        if hasattr(o, "__dict__"):
+            return o.__dict__
+        # slotted objects
+        return {
+            name: getattr(o, name)
+            for cls in reversed(type(o).__mro__)
+            for name in getattr(cls, "__slots__", ())
+        }
 
 
 class ReportObject:
+    """
+    An object of the report, built from an API response.
+    The response data isn't kept after the attributes extraction and the subclasses declare their attributes in
+     __slots__, as a hub model can have tens of thousands of downstream elements.
+    """
+
+    __slots__ = ()
+
     def __init__(self, data: dict):
-        self._raw_data = data
-        self._extract_attributes(data=self._raw_data)
+        self._extract_attributes(data=data)
 
     def _extract_attributes(self, data: dict):
         raise NotImplementedError(
             "A BitBucket object must implement the attributes extraction from json response"
         )
 
+    def to_payload(self) -> dict:
+        """
+        Builds the API-like data that creates an equivalent object, used to store the object out of the run
+        """
+        raise NotImplementedError(
+            "A stored object must implement its payload extraction"
+        )
+
     def __str__(self):
         return ReportObjectEncoder().encode(self)
 
 
 class Popularity(ReportObject):
+    __slots__ = ("popularity", "count", "users_count")
+
     def _extract_attributes(self, data: dict):
         self.popularity = data.get("popularity")
         self.count = data.get("query_count") or data.get("view_count") or 0
         self.users_count = data.get("user_count") or 0
 
+    def to_payload(self) -> dict:
+        return {
+            "popularity": self.popularity,
+            "query_count": self.count,
+            "user_count": self.users_count,
+        }
+
 
 class DownstreamElement(ReportObject):
+    __slots__ = (
+        "guid",
+        "name",
+        "type",
+        "full_name",
+        "data_source_type",
+        "linked_objects",
+        "popularity",
+        "impact_score",
+    )
+
     def _extract_attributes(self, data: dict):
         self.guid = data.get("guid")
         self.name = data.get("name")
-        self.type = data.get("data_type") or "-"
+        self.type = intern(data.get("data_type") or "-")
         self.full_name = data.get("full_name")
-        self.data_source_type = data.get("data_source_type")
-        self.linked_objects = data.get("linked_objs") or []
-        self.linked_object_data_source_type = None
+        self.data_source_type = intern(data.get("data_source_type"))
+        self.linked_objects = tuple(data.get("linked_objs") or ())
+        # weighted by popularity and data source type, see scoring.py
+        self.impact_score = 0.0
         if data.get("popularity"):
             self.popularity = Popularity(data.get("popularity"))
         else:
             self.popularity = None
 
+    def to_payload(self) -> dict:
+        return {
+            "guid": self.guid,
+            "name": self.name,
+            "data_type": self.type,
+            "full_name": self.full_name,
+            "data_source_type": self.data_source_type,
+            "linked_objs": list(self.linked_objects),
+            "popularity": self.popularity.to_payload() if self.popularity else None,
+        }
+
     def __str__(self):
         return f"{self.guid=} {self.name=} {self.full_name=} {self.data_source_type=} {{{self.popularity}}}"
 
 
 class DataSource(ReportObject):
+    __slots__ = ("guid", "name", "type")
+
     def _extract_attributes(self, data: dict):
         self.guid = data.get("guid")
         self.name = data.get("name")
-        self.type = data.get("type")
+        self.type = intern(data.get("type"))
+
+    def to_payload(self) -> dict:
+        return {"guid": self.guid, "name": self.name, "type": self.type}
 
 
 class DataBase(ReportObject):
+    __slots__ = ("guid", "name", "data_source")
+
     def _extract_attributes(self, data: dict):
         self.guid = data.get("guid")
         self.name = data.get("name")
         self.data_source = DataSource(data.get("data_source"))
 
+    def to_payload(self) -> dict:
+        return {
+            "guid": self.guid,
+            "name": self.name,
+            "data_source": self.data_source.to_payload(),
+        }
+
 
 class Schema(ReportObject):
+    __slots__ = ("guid", "name")
+
     def _extract_attributes(self, data: dict):
         self.guid = data.get("guid")
         self.name = data.get("name")
 
+    def to_payload(self) -> dict:
+        return {"guid": self.guid, "name": self.name}
+
 
 class TableLinked(ReportObject):
+    __slots__ = ("guid", "name", "database", "schema", "downstream_elements")
+
     def _extract_attributes(self, data: dict):
         self.guid = data.get("guid")
         self.name = data.get("name")
@@ -73,8 +156,18 @@ class TableLinked(ReportObject):
         self.schema = Schema(data.get("schema"))
         self.downstream_elements = []
 
+    def to_payload(self) -> dict:
+        return {
+            "guid": self.guid,
+            "name": self.name,
+            "database": self.database.to_payload(),
+            "schema": self.schema.to_payload(),
+        }
+
 
 class WarehouseLink(ReportObject):
+    __slots__ = ("guid", "table")
+
     def __init__(self, data: dict):
         super().__init__(data)
         self.table = None
@@ -85,18 +178,89 @@ class WarehouseLink(ReportObject):
     def set_table(self, data: dict):
         self.table = TableLinked(data=data)
 
+    def to_payload(self) -> dict:
+        return {"warehouse_table": {"guid": self.guid}}
+
+
+class LineageGraph:
+    """
+    Downstream graph of a dbt model, split by depth level
+    """
+
+    def __init__(self):
+        # depth -> elements first reached at this depth
+        self.levels: dict[int, list[DownstreamElement]] = {}
+        # guid -> guids of its direct downstream elements
+        self.edges: dict[str, list[str]] = {}
+        # True when the node budget stopped the walk before the requested depth
+        self.truncated = False
+
+
+class SharedDownstreamElement:
+    """
+    A downstream element affected by more than one changed dbt model
+    """
+
+    __slots__ = ("element", "models")
+
+    def __init__(self, element: DownstreamElement):
+        self.element = element
+        self.models: list[DbtModel] = []
+
 
 class DbtModel(ReportObject):
-    def __init__(self, data: dict, project_relative_filepath: str):
+    def __init__(
+        self,
+        data: dict,
+        project_relative_filepath: str,
+        previous_project_relative_filepath: str | None = None,
+    ):
         super().__init__(data)
         self.project_relative_filepath = project_relative_filepath
+        # the path before a rename, still the one known by Select Star until the change is merged
+        self.previous_project_relative_filepath = previous_project_relative_filepath
 
     def _extract_attributes(self, data: dict):
         self.filepath = data.get("filename")
         self.filename = self.filepath.split("/")[-1]
         self.status = data.get("status")
+        # the git blob SHA of the file content
+        self.sha = data.get("sha")
+        # True when the lineage comes from the state of the previous report
+        self.restored_from_state = False
         self.guid = None
+        # the dbt node of the model, read from the manifest when DBT_MANIFEST_PATH is set
+        self.unique_id: str | None = None
+        self.database: str | None = None
+        self.schema: str | None = None
+        self.alias: str | None = None
+        # the output columns touched by the patch in column-level mode, None for the table-level lineage
+        self.changed_columns: frozenset[str] | None = None
         self.warehouse_links = []
         self.downstream_elements = []
         # my downstream elements + warehouse linked table downstream elements
         self.all_unique_downstream_elements = []
+        # element guid -> data source type of the linked object merged into it, the elements are shared by the models
+        self.linked_object_data_source_types: dict[str, str] = {}
+        # the downstream beyond the direct elements, when a lineage depth > 1 is requested
+        self.lineage_graph: LineageGraph | None = None
+        # the weighted impact of the downstream elements, see scoring.py
+        self.impact_score = 0.0
+
+    @property
+    def lookup_filepath(self) -> str:
+        """
+        The path used to find the model on Select Star
+        """
+        return self.previous_project_relative_filepath or self.project_relative_filepath
+
+    @property
+    def full_name(self) -> str | None:
+        """
+        The fully-qualified name of the model relation, e.g. "analytics.finance.orders"
+        """
+        if not self.alias:
+            return None
+        return ".".join(
+            part for part in (self.database, self.schema, self.alias) if part
+        )
@@ -1,145 +1,504 @@
+import hashlib
 import logging
+import os
 import re
+import subprocess
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
+from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
 
 import requests
 
+from cache import ResponseCache, RevalidationCache
+from columns import parse_changed_columns
 from dataobjects import DbtModel
 from exceptions import APIException
 from settings import AppSettings
+from transport import build_session
 
 log = logging.getLogger(__name__)
 
+# marks the impact report comment as not searched yet, as None means not found
+NOT_SEARCHED = object()
+
+# the files API of a pull request doesn't list more files than this
+MAX_CHANGED_FILES = 3000
+
+# status letters of `git diff --raw` -> status of the files API
+DIFF_STATUSES = {
+    "A": "added",
+    "C": "copied",
+    "D": "removed",
+    "M": "modified",
+    "R": "renamed",
+    "T": "changed",
+}
+# the blob SHA of a missing file in `git diff --raw`
+NULL_SHA = "0" * 40
+
+
+def parse_raw_diff(output: str) -> list[dict]:
+    """
+    Parse the output of `git diff --raw -z --no-abbrev` in the format of the files API of a pull request
+    :param output: the diff output, fields are separated by NUL characters
+    :return: the changed files, with their filename, status, blob SHA and previous filename when renamed
+    """
+    files = []
+    fields = iter(output.split("\0"))
+    for metadata in fields:
+        if not metadata.startswith(":"):
+            continue
+        _, _, source_sha, destination_sha, status = metadata[1:].split(" ")
+        file = {
+            "status": DIFF_STATUSES.get(status[0], "changed"),
+            "sha": destination_sha if destination_sha != NULL_SHA else source_sha,
+        }
+        # renames and copies have a score after their letter and are followed by both paths
+        if status[0] in "RC":
+            file["previous_filename"] = next(fields)
+        file["filename"] = next(fields)
+        files.append(file)
+
+    return files
+
 
 class Git:
     comment_anchor = "<!-- ImpactReportIdentifier: select-star-dbt-impact-report -->"
+    # longer comments are rejected by the git provider
+    comment_max_chars = 65536
 
     def __init__(self, settings: dict):
         self.settings = settings
         self.repository = self.settings.get(AppSettings.GIT_REPOSITORY)
         self.pull_request_id = self.settings.get(AppSettings.PULL_REQUEST_ID)
-        self.session = requests.Session()
-        self.session.headers.update(
-            {
+        self.max_concurrency = self.settings.get(AppSettings.GIT_MAX_CONCURRENCY)
+        self.changed_files_source = self.settings.get(
+            AppSettings.GIT_CHANGED_FILES_SOURCE
+        )
+        self.column_lineage = (
+            self.settings.get(AppSettings.SELECTSTAR_LINEAGE_MODE) == "column"
+        )
+        self.session = build_session(
+            settings=settings,
+            pool_size=self.max_concurrency,
+            headers={
                 "Authorization": f"Bearer {settings.get(AppSettings.GIT_REPOSITORY_TOKEN)}",
                 "User-Agent": "Select Star Dbt Impact Report",
-            }
+            },
+        )
+        # the GET responses of previous runs, sent back to the git provider with their ETag
+        self.revalidation_cache = RevalidationCache.from_settings(settings)
+        self.impact_report_comment: dict | None = NOT_SEARCHED
+        self.comment_cache_key = ResponseCache.build_key(
+            "impact_report_comment",
+            self.repository,
+            {"pull_request_id": self.pull_request_id},
         )
+        self.cached_comment: dict | None = self.__read_cached_comment()
         self.user: dict = (
             self.__get_authenticated_user()
             if not self.settings.get(AppSettings.GIT_CI)
             else None
         )
 
-    def get_changed_files(self):
+    def get_changed_files(self) -> list[DbtModel]:
         """
         Gets a list of changed models based on the list of changed files of the informed pull request
         :return: changed models
         """
-        url = self._get_change_files_url()
+        found_models = list(self.iter_changed_models())
 
-        response = self.session.get(url)
+        log.info(f"Found models: {[(f.filepath, f.status) for f in found_models]}")
 
-        if response.status_code != 200:
-            raise APIException(response=response)
+        return found_models
+
+    def iter_changed_models(self) -> Iterator[DbtModel]:
+        """
+        Yields the changed models page by page, so the files of a large pull request are filtered as they arrive
+         instead of being held together. The lineage still starts once every page is read, see get_changed_files.
+        :return: changed models generator
+        """
+        found_models: set[str] = set()
 
+        pages = (
+            self.__iter_local_changed_files_pages()
+            if self.changed_files_source == "local"
+            else self.__iter_changed_files_pages()
+        )
+        for files in pages:
+            log.info(
+                f"Files in this PR: {[(f.get('filename'), f.get('status')) for f in files]}"
+            )
+
+            for file in files:
+                result = re.search(
+                    r"models/(.+/)?\w+\.sql$", file.get("filename"), flags=re.IGNORECASE
+                )
+                if result:
+                    project_relative_filepath = result.group(0)
+                    previous_result = re.search(
+                        r"models/(.+/)?\w+\.sql$",
+                        file.get("previous_filename") or "",
+                        flags=re.IGNORECASE,
+                    )
+                    # the repository path, the same project path can change in several projects of a monorepo
+                    filepath = file.get("filename")
+                    if filepath in found_models:
+                        log.warning(f"Model {filepath} already found. Skipping.")
+                    else:
+                        found_models.add(filepath)
+                        dbt_model = DbtModel(
+                            data=file,
+                            project_relative_filepath=project_relative_filepath,
+                            previous_project_relative_filepath=previous_result.group(0)
+                            if previous_result
+                            else None,
+                        )
+                        # the patch is missing from the local diff and from the too large changes
+                        if self.column_lineage and file.get("status") == "modified":
+                            dbt_model.changed_columns = parse_changed_columns(
+                                file.get("patch")
+                            )
+                        yield dbt_model
+
+    def __iter_changed_files_pages(self) -> Iterator[list[dict]]:
+        """
+        Yields every page of changed files, in order.
+        Once the first page tells the total number of pages, the remaining ones are fetched concurrently.
+        :return: pages generator
+        """
+        response = self.__get_page(self._get_change_files_url())
         files = response.json()
+        files_count = len(files)
+        yield files
+
+        if "last" in response.links:
+            last_page_url = response.links["last"]["url"]
+            last_page = int(parse_qs(urlparse(last_page_url).query)["page"][0])
+            pages_urls = [
+                self.__set_page(last_page_url, page) for page in range(2, last_page + 1)
+            ]
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                for page_response in executor.map(self.__get_page, pages_urls):
+                    files = page_response.json()
+                    files_count += len(files)
+                    yield files
+        else:
+            # the total number of pages is unknown, follow the next links one by one
+            while "next" in response.links:
+                response = self.__get_page(response.links["next"]["url"])
+                files = response.json()
+                files_count += len(files)
+                yield files
+
+        if files_count >= MAX_CHANGED_FILES:
+            log.warning(
+                f"The git provider lists only the first {MAX_CHANGED_FILES} files of a pull request."
+                " Models beyond this limit are not in the report."
+            )
+
+    def __iter_local_changed_files_pages(self) -> Iterator[list[dict]]:
+        """
+        Yields the changed files of the checked-out repository as a single page, diffing the head against its merge
+         base with the base of the pull request. Renames are detected like in the files API.
+        :return: pages generator
+        """
+        base_ref = self.settings.get(AppSettings.GIT_BASE_REF)
+        head_ref = self.settings.get(AppSettings.GIT_HEAD_REF)
+        if not base_ref:
+            raise KeyError(
+                "GIT_BASE_REF is required when GIT_CHANGED_FILES_SOURCE is local"
+            )
 
-        if len(files) == 100:
-            log.warning("Processing only the first 100 files on this pull request.")
+        merge_base = self.__run_git("merge-base", base_ref, head_ref).strip()
+        log.info(f"Diffing {head_ref=} against its merge base {merge_base=}")
 
-        found_models: dict[str, DbtModel] = {}
+        yield parse_raw_diff(
+            self.__run_git(
+                "diff", "--raw", "-z", "--no-abbrev", "-M", merge_base, head_ref
+            )
+        )
 
-        log.info(
-            f"Files in this PR: {[(f.get('filename'), f.get('status')) for f in files]}"
+    @staticmethod
+    def __run_git(*args: str) -> str:
+        # the workspace is owned by another user inside a docker action
+        completed_process = subprocess.run(
+            ["git", "-c", "safe.directory=*", *args],
+            cwd=os.environ.get("GITHUB_WORKSPACE") or None,
+            capture_output=True,
+            text=True,
         )
 
-        for file in files:
-            result = re.search(
-                r"models/(.+/)?\w+\.sql$", file.get("filename"), flags=re.IGNORECASE
+        if completed_process.returncode != 0:
+            raise Exception(
+                f"Command git {' '.join(args)} failed. Message {completed_process.stderr}."
+                " Is the base of the pull request fetched? e.g. actions/checkout with fetch-depth: 0"
             )
-            if result:
-                project_relative_filepath = result.group(0)
-                if project_relative_filepath in found_models:
-                    log.warning(
-                        f"Model {project_relative_filepath} already found. Skipping."
-                    )
-                else:
-                    found_models[project_relative_filepath] = DbtModel(
-                        data=file, project_relative_filepath=result.group(0)
-                    )
 
-        log.info(
-            f"Found models: {[(f.project_relative_filepath, f.status) for f in list(found_models.values())]}"
+        return completed_process.stdout
+
+    def __get(self, url: str) -> requests.Response:
+        """
+        Send a GET request, with the ETag of the response cached by a previous run. The git provider answers an
+         unchanged resource with a 304 Not Modified, which doesn't count against its rate limit.
+        :param url: the URL to be requested
+        :return: the response, rebuilt from the cache when the resource didn't change
+        """
+        if not self.revalidation_cache:
+            return self.session.get(url)
+
+        cache_key = ResponseCache.build_key("git", url)
+        cached_response = self.revalidation_cache.get(cache_key)
+        response = self.session.get(
+            url,
+            headers={"If-None-Match": cached_response["etag"]}
+            if cached_response
+            else None,
         )
 
-        return list(found_models.values())
+        if response.status_code == 304 and cached_response:
+            # stored again, so the entries of the revalidated responses don't expire
+            self.revalidation_cache.set(cache_key, cached_response)
+            return self.__build_cached_response(url, cached_response)
+
+        if response.status_code == 200 and response.headers.get("ETag"):
+            self.revalidation_cache.set(
+                cache_key,
+                {
+                    "etag": response.headers["ETag"],
+                    # the pagination links
+                    "link": response.headers.get("Link"),
+                    "body": response.text,
+                },
+            )
 
-    def __get_impact_report_comment_id(self) -> dict | None:
-        url = self._get_list_comments_url()
+        return response
 
-        response = self.session.get(url)
+    @staticmethod
+    def __build_cached_response(url: str, cached_response: dict) -> requests.Response:
+        response = requests.Response()
+        response.url = url
+        response.status_code = 200
+        response.encoding = "utf-8"
+        response.headers["ETag"] = cached_response["etag"]
+        if cached_response["link"]:
+            response.headers["Link"] = cached_response["link"]
+        response._content = cached_response["body"].encode()
+        return response
+
+    def __get_page(self, url: str) -> requests.Response:
+        response = self.__get(url)
 
         if response.status_code != 200:
             raise APIException(response=response)
 
-        comments = response.json()
+        return response
 
-        for comment in comments:
-            if self.settings.get(AppSettings.GIT_CI):
-                if comment["user"]["login"] == "github-actions[bot]":
-                    return comment
-            else:
-                if comment["user"]["login"] == self.user["login"]:
-                    return comment
+    @staticmethod
+    def __set_page(url: str, page: int) -> str:
+        parsed_url = urlparse(url)
+        query = parse_qs(parsed_url.query) | {"page": [str(page)]}
+        return urlunparse(parsed_url._replace(query=urlencode(query, doseq=True)))
+
+    def __search_impact_report_comment(self) -> dict | None:
+        """
+        Search the impact report comment from the newest comments page to the oldest one, stopping at the first match.
+        The comments API lists the oldest comments first, so the first page only tells where the last page is.
+        :return: the comment, or None when there is no previous report
+        """
+        response = self.__get_page(f"{self._get_list_comments_url()}?per_page=100")
+        first_page_comments = response.json()
+
+        if "last" in response.links:
+            last_page_url = response.links["last"]["url"]
+            last_page = int(parse_qs(urlparse(last_page_url).query)["page"][0])
+            for page in range(last_page, 1, -1):
+                comments = self.__get_page(self.__set_page(last_page_url, page)).json()
+                found_comment = self.__find_impact_report_comment(comments)
+                if found_comment:
+                    return found_comment
+
+        return self.__find_impact_report_comment(first_page_comments)
+
+    def __find_impact_report_comment(self, comments: list[dict]) -> dict | None:
+        report_author = (
+            "github-actions[bot]"
+            if self.settings.get(AppSettings.GIT_CI)
+            else self.user["login"]
+        )
+        for comment in reversed(comments):
+            if self.__is_impact_report_comment(comment, report_author):
+                return comment
+
+    def __is_impact_report_comment(self, comment: dict, report_author: str) -> bool:
+        return comment["user"]["login"] == report_author and (
+            comment.get("body") or ""
+        ).startswith(self.comment_anchor)
+
+    def __get_cached_impact_report_comment(self) -> dict | None:
+        """
+        Get the impact report comment whose id was cached by a previous run, checking it still exists
+        :return: the comment, or None when it isn't cached or was deleted
+        """
+        if not self.cached_comment:
+            return None
+
+        response = self.__get(
+            self._get_detail_comments_url(commend_id=self.cached_comment["id"])
+        )
+        if response.status_code != 200 or not (
+            response.json().get("body") or ""
+        ).startswith(self.comment_anchor):
+            log.info("The cached impact report comment is gone.")
+            return None
+
+        return response.json()
+
+    def get_impact_report_comment(self) -> dict | None:
+        """
+        Get the impact report comment created by a previous run, searched only once per run
+        :return: the comment, or None when there is no previous report
+        """
+        if self.impact_report_comment is NOT_SEARCHED:
+            log.info("Searching for previous impact report.")
+            self.impact_report_comment = (
+                self.__get_cached_impact_report_comment()
+                or self.__search_impact_report_comment()
+            )
+        return self.impact_report_comment
 
     def __insert_impact_report(self, body: str) -> dict:
         url = self._get_list_comments_url()
 
-        body = f"{self.comment_anchor}\n{body}"
-
         response = self.session.post(url, json={"body": body})
 
+        if response.status_code != 201:
+            raise APIException(response=response)
+
         return response.json()
 
-    def __update_impact_report(self, comment_id: str, body: str):
+    def __update_impact_report(self, comment_id: str, body: str) -> dict | None:
         url = self._get_detail_comments_url(commend_id=comment_id)
 
-        body = f"{self.comment_anchor}\n{body}"
-
         response = self.session.patch(url, json={"body": body})
 
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise APIException(response=response)
+
         return response.json()
 
-    def insert_or_update_impact_report(self, body) -> None:
+    def get_report_max_chars(self, state: str | None = None) -> int:
+        """
+        Get the maximum length of a report, once the comment anchor and the state block are added to the comment
+        :param state: optional, the hidden state block placed after the comment anchor
+        :return: the maximum number of characters
+        """
+        return self.comment_max_chars - len(self.comment_anchor) - len(state or "") - 2
+
+    def insert_or_update_impact_report(self, body, state: str | None = None) -> None:
         """
-        Insert or Replace the current impact report
+        Insert or Replace the current impact report.
+        When the comment id is cached and the report wasn't read in this run, the update is a single PATCH.
+        The update is skipped when the report didn't change.
         :param body: the report to be placed inside the impact report comment
+        :param state: optional, the hidden state block placed after the comment anchor
         """
-        logging.info("Searching for previous impact report.")
-        found_comment = self.__get_impact_report_comment_id()
+        body = (
+            f"{self.comment_anchor}\n{state}\n{body}"
+            if state
+            else f"{self.comment_anchor}\n{body}"
+        )
+        body_hash = hashlib.sha256(body.encode()).hexdigest()
+
+        if (
+            self.impact_report_comment is NOT_SEARCHED
+            and self.cached_comment
+            and self.cached_comment["body_hash"] != body_hash
+        ):
+            updated_comment = self.__update_impact_report(
+                comment_id=self.cached_comment["id"], body=body
+            )
+            if updated_comment:
+                log.info(
+                    f'Cached impact report updated. id={updated_comment["id"]}'
+                    f' url={updated_comment["html_url"]}.'
+                )
+                self.__cache_impact_report_comment(updated_comment, body_hash)
+                return
+            log.info("The cached impact report comment is gone.")
+            self.cached_comment = None
+
+        found_comment = self.get_impact_report_comment()
+
+        if found_comment and found_comment.get("body") == body:
+            log.info(
+                f'Impact report unchanged, skipping its update. id={found_comment["id"]}'
+            )
+            self.__cache_impact_report_comment(found_comment, body_hash)
+            return
 
         if found_comment:
-            logging.info(
+            log.info(
                 f'Previous impact report found. id={found_comment["id"]}'
                 f' url={found_comment["html_url"]}.'
             )
-            self.__update_impact_report(comment_id=found_comment["id"], body=body)
-            logging.info(
-                f'Previous impact report updated. id={found_comment["id"]}'
-                f' url={found_comment["html_url"]}.'
+            updated_comment = self.__update_impact_report(
+                comment_id=found_comment["id"], body=body
             )
-        else:
-            logging.info(f"Previous impact report not found, creating a new one.")
-            new_comment = self.__insert_impact_report(body)
-            logging.info(
-                f'New impact report created. id={new_comment["id"]} url={new_comment["html_url"]}.'
+            if updated_comment:
+                log.info(
+                    f'Previous impact report updated. id={found_comment["id"]}'
+                    f' url={found_comment["html_url"]}.'
+                )
+                self.__cache_impact_report_comment(updated_comment, body_hash)
+                return
+            # deleted since it was found
+            log.info("The previous impact report comment is gone.")
+
+        log.info(f"Previous impact report not found, creating a new one.")
+        new_comment = self.__insert_impact_report(body)
+        log.info(
+            f'New impact report created. id={new_comment["id"]} url={new_comment["html_url"]}.'
+        )
+        self.__cache_impact_report_comment(new_comment, body_hash)
+
+    def __read_cached_comment(self) -> dict | None:
+        """
+        Read the id and body hash of the impact report comment cached by a previous run.
+        The cache is opened only for this lookup, so it isn't locked while the lineage is fetched.
+        :return: the cached comment, or None
+        """
+        cache = ResponseCache.from_settings(self.settings)
+        if not cache:
+            return None
+        cached_comment = cache.get(self.comment_cache_key)
+        cache.close()
+        return cached_comment
+
+    def __cache_impact_report_comment(self, comment: dict | None, body_hash: str):
+        cache = ResponseCache.from_settings(self.settings)
+        if cache and comment:
+            cache.set(
+                self.comment_cache_key, {"id": comment["id"], "body_hash": body_hash}
             )
+        if cache:
+            cache.close()
+
+    def close(self):
+        """
+        Release the resources held by this interface, saving the revalidation cache
+        """
+        self.session.close()
+        if self.revalidation_cache:
+            self.revalidation_cache.close()
 
     def __get_authenticated_user(self) -> dict:
         url = self._get_git_user_url()
 
-        response = self.session.get(url)
+        response = self.__get(url)
 
         if response.status_code != 200:
             raise APIException(response=response)
@@ -165,25 +524,23 @@ class GitHub(Git):
     """
 
     def __init__(self, settings: dict):
-        self.host = "api.github.com"
+        self.api_url = settings.get(AppSettings.GIT_API_URL)
         super().__init__(settings=settings)
 
     def _get_change_files_url(self) -> str:
-        url = f"https://{self.host}/repos/{self.repository}/pulls/{self.pull_request_id}/files?per_page=100"
+        url = f"{self.api_url}/repos/{self.repository}/pulls/{self.pull_request_id}/files?per_page=100"
         return url
 
     def _get_list_comments_url(self) -> str:
-        url = f"https://{self.host}/repos/{self.repository}/issues/{self.pull_request_id}/comments"
+        url = f"{self.api_url}/repos/{self.repository}/issues/{self.pull_request_id}/comments"
         return url
 
     def _get_detail_comments_url(self, commend_id: str) -> str:
-        url = (
-            f"https://{self.host}/repos/{self.repository}/issues/comments/{commend_id}"
-        )
+        url = f"{self.api_url}/repos/{self.repository}/issues/comments/{commend_id}"
         return url
 
     def _get_git_user_url(self) -> str:
-        url = f"https://{self.host}/user"
+        url = f"{self.api_url}/user"
         return url
 
 
@@ -0,0 +1,79 @@
+import logging
+
+import ijson
+
+from dataobjects import DbtModel
+from selectstar import normalize_path, path_suffixes
+from settings import AppSettings
+
+log = logging.getLogger(__name__)
+
+
+class DbtManifest:
+    """
+    Reader of the dbt manifest.json created by `dbt compile`, `dbt run` or `dbt build`.
+    The manifest is parsed as a stream, one node at a time, so the memory use doesn't depend on its size.
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+
+    @classmethod
+    def from_settings(cls, settings: dict) -> "DbtManifest | None":
+        """
+        Creates the manifest reader described by the settings
+        :param settings: the app settings
+        :return: the manifest reader, or None when no manifest path is set
+        """
+        filepath = settings.get(AppSettings.DBT_MANIFEST_PATH)
+        if not filepath:
+            return None
+
+        log.info(f"Using the dbt manifest at {filepath=}")
+
+        return cls(filepath=filepath)
+
+    def resolve_models(self, dbt_models: list[DbtModel]) -> int:
+        """
+        Set the unique id, database, schema and alias of the given models from their manifest node.
+        Parsing stops as soon as every model is found.
+        :param dbt_models: the changed dbt models
+        :return: the number of models found in the manifest
+        """
+        # normalized suffix of the repository path -> models, the project path of a node is one of these suffixes
+        models_by_suffix: dict[str, list[DbtModel]] = {}
+        for model in dbt_models:
+            for suffix in path_suffixes(model.filepath):
+                models_by_suffix.setdefault(suffix, []).append(model)
+        found_models = 0
+
+        with open(self.filepath, "rb") as manifest_file:
+            for unique_id, node in ijson.kvitems(manifest_file, "nodes"):
+                if node.get("resource_type") != "model":
+                    continue
+
+                node_path = normalize_path(node.get("original_file_path", ""))
+                models = models_by_suffix.get(node_path, [])
+                if len(models) > 1:
+                    # the same project path changed in several projects, the manifest doesn't tell which one it is
+                    log.warning(
+                        f"Manifest node {unique_id} matches {len(models)} changed models. Skipping."
+                    )
+                    continue
+                if not models or models[0].unique_id:
+                    continue
+
+                model = models[0]
+                model.unique_id = unique_id
+                model.database = node.get("database")
+                model.schema = node.get("schema")
+                model.alias = node.get("alias") or node.get("name")
+                found_models += 1
+                if found_models == len(dbt_models):
+                    break
+
+        log.info(
+            f"Found {found_models} of {len(dbt_models)} models in the dbt manifest."
+        )
+
+        return found_models
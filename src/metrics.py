@@ -0,0 +1,210 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+
+def percentile(values: list[float], percent: int) -> float:
+    """
+    Nearest-rank percentile of the given values
+    :param values: a non-empty list of values
+    :param percent: the percentile, from 0 to 100
+    :return: the percentile value
+    """
+    sorted_values = sorted(values)
+    rank = max(round(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class EndpointMetrics:
+    """
+    Counters of the requests sent to a single endpoint template
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        # the bytes transferred, and the bytes of the bodies once decompressed
+        self.bytes = 0
+        self.decoded_bytes = 0
+        self.latencies: list[float] = []
+
+
+class Metrics:
+    """
+    Run instrumentation: wall time per stage, requests per endpoint and cache lookups.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Clear all the recorded metrics, starting a new run
+        """
+        self.started_at = time.monotonic()
+        self.stages: dict[str, float] = {}
+        self.endpoints: dict[str, EndpointMetrics] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Measure the wall time of the enclosed block, added to the given stage
+        :param name: the stage name
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            log.info(f"Stage {name} took {elapsed:.3f}s")
+
+    def record_request(
+        self,
+        endpoint: str,
+        latency: float,
+        size: int,
+        decoded_size: int | None = None,
+        is_retry: bool = False,
+    ):
+        """
+        Record a request sent to the given endpoint
+        :param endpoint: the endpoint template
+        :param latency: the request latency in seconds
+        :param size: the response body size in bytes, as transferred
+        :param decoded_size: the response body size in bytes once decompressed, by default the transferred size
+        :param is_retry: if the request is a retry of a failed one
+        """
+        with self._lock:
+            endpoint_metrics = self.endpoints.setdefault(endpoint, EndpointMetrics())
+            endpoint_metrics.requests += 1
+            endpoint_metrics.retries += 1 if is_retry else 0
+            endpoint_metrics.bytes += size
+            endpoint_metrics.decoded_bytes += (
+                size if decoded_size is None else decoded_size
+            )
+            endpoint_metrics.latencies.append(latency)
+
+    def record_transfer(self, endpoint: str, size: int, decoded_size: int):
+        """
+        Record the body of a response read after its request was recorded, e.g. a streamed body
+        :param endpoint: the endpoint template
+        :param size: the response body size in bytes, as transferred
+        :param decoded_size: the response body size in bytes once decompressed
+        """
+        with self._lock:
+            endpoint_metrics = self.endpoints.setdefault(endpoint, EndpointMetrics())
+            endpoint_metrics.bytes += size
+            endpoint_metrics.decoded_bytes += decoded_size
+
+    def record_cache_lookup(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def summary(self) -> dict:
+        """
+        Get the machine-readable summary of the run
+        :return: the summary
+        """
+        cache_lookups = self.cache_hits + self.cache_misses
+        return {
+            "wall_time": round(time.monotonic() - self.started_at, 3),
+            "stages": {name: round(value, 3) for name, value in self.stages.items()},
+            "requests": sum(endpoint.requests for endpoint in self.endpoints.values()),
+            "bytes": sum(endpoint.bytes for endpoint in self.endpoints.values()),
+            "decoded_bytes": sum(
+                endpoint.decoded_bytes for endpoint in self.endpoints.values()
+            ),
+            "endpoints": {
+                name: {
+                    "requests": endpoint.requests,
+                    "retries": endpoint.retries,
+                    "bytes": endpoint.bytes,
+                    "decoded_bytes": endpoint.decoded_bytes,
+                    "p50_latency": round(percentile(endpoint.latencies, 50), 3),
+                    "p95_latency": round(percentile(endpoint.latencies, 95), 3),
+                }
+                for name, endpoint in sorted(self.endpoints.items())
+            },
+            "cache": {
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "hit_rate": round(self.cache_hits / cache_lookups, 3)
+                if cache_lookups
+                else None,
+            },
+        }
+
+    def log(self):
+        """
+        Log the stages wall time and the requests of every endpoint
+        """
+        summary = self.summary()
+        log.info(
+            f"Run took {summary['wall_time']}s, {summary['requests']} requests,"
+            f" {summary['bytes']} bytes received ({summary['decoded_bytes']} decoded)."
+        )
+        for name, endpoint in summary["endpoints"].items():
+            log.info(
+                f"   {name}: {endpoint['requests']} requests, {endpoint['retries']} retries,"
+                f" {endpoint['bytes']} bytes ({endpoint['decoded_bytes']} decoded),"
+                f" p50 {endpoint['p50_latency']}s, p95 {endpoint['p95_latency']}s"
+            )
+
+    def write(self, filepath: str | None):
+        """
+        Write the summary to a JSON file and, inside GitHub Actions, to the job summary
+        :param filepath: the JSON file path, or None to skip it
+        """
+        summary = self.summary()
+
+        if filepath:
+            with open(filepath, "w") as metrics_file:
+                json.dump(summary, metrics_file, indent=2)
+            log.info(f"Metrics written to {filepath}")
+
+        step_summary_filepath = os.environ.get("GITHUB_STEP_SUMMARY")
+        if step_summary_filepath:
+            with open(step_summary_filepath, "a") as step_summary_file:
+                step_summary_file.write(self.__print_markdown(summary))
+
+    @staticmethod
+    def __print_markdown(summary: dict) -> str:
+        lines = [
+            "### Select Star Impact Report metrics\n",
+            f"Wall time: **{summary['wall_time']}s**, requests: **{summary['requests']}**,"
+            f" bytes received: **{summary['bytes']}** (**{summary['decoded_bytes']}** decoded)",
+        ]
+        if summary["cache"]["hit_rate"] is not None:
+            lines.append(f", cache hit rate: **{summary['cache']['hit_rate']:.1%}**")
+        lines.append("\n\n| Stage | Wall time (s) |\n|--------|--------|\n")
+        for name, value in summary["stages"].items():
+            lines.append(f"|{name}|{value}|\n")
+        lines.append(
+            "\n| Endpoint | Requests | Retries | Bytes | Decoded bytes | p50 (s) | p95 (s) |\n"
+            "|--------|--------|--------|--------|--------|--------|--------|\n"
+        )
+        for name, endpoint in summary["endpoints"].items():
+            lines.append(
+                f"|{name}|{endpoint['requests']}|{endpoint['retries']}|{endpoint['bytes']}"
+                f"|{endpoint['decoded_bytes']}|{endpoint['p50_latency']}|{endpoint['p95_latency']}|\n"
+            )
+        lines.append("\n")
+
+        return "".join(lines)
+
+
+# the instrumentation of the current run
+metrics = Metrics()
@@ -1,76 +1,216 @@
-from operator import attrgetter
+import os
+from collections import Counter
+from io import StringIO
+from operator import attrgetter, itemgetter
+from typing import TextIO
 
-from dataobjects import DbtModel
+from dataobjects import (
+    DbtModel,
+    DownstreamElement,
+    LineageGraph,
+    SharedDownstreamElement,
+)
 from settings import AppSettings
 
 HTML_FOR_WARNING_SIGN = "&#x26a0;&#xfe0f;"
 HTML_FOR_WHITE_CHECK_MARK = "&#x2705;"
 
+# maximum number of rows per table tried in turn until the report fits its size limit, None for all of them
+MAX_ROWS_STEPS = [None, 500, 100, 25, 5, 0]
+# GitHub rejects larger job summaries
+STEP_SUMMARY_MAX_CHARS = 1_000_000
+TRUNCATED_REPORT_NOTE = "\n<br/>The report is too long, only the downstream objects with the highest impact are listed."
+
 
 class ReportPrinter:
     def __init__(self, settings: dict):
         self.settings = settings
         self.select_star_web_url = settings.get(AppSettings.SELECTSTAR_WEB_URL)
+        # True when the last printed report left downstream objects or models out
+        self.truncated = False
 
-    def print(self, models: list[DbtModel]):
+    def print(
+        self,
+        models: list[DbtModel],
+        shared_downstream: list[SharedDownstreamElement] | None = None,
+        max_chars: int | None = None,
+        spill_note: bool = False,
+    ):
         """
         Creates the impact report
         :param models: a list of dbt models
+        :param shared_downstream: optional, the downstream elements affected by more than one model. When informed,
+         they are listed once in their own section instead of in every model table.
+        :param max_chars: optional, the maximum length of the report. When the complete report is longer, the tables
+         keep only their objects with the highest impact score and the other ones are counted per data source and object type.
+        :param spill_note: if a truncated report tells the full one is in the job summary
         :return: the complete, final text of the report
         """
+        shared_guids = {
+            shared_element.element.guid for shared_element in shared_downstream or []
+        }
 
-        elements: list[
-            [int, str]
-        ] = []  # number of impacts per block + the block itself
-
-        total_impact_number = 0
+        # impact score per model + the model title, the blocks are sorted by both, descending
+        blocks: list[tuple[float, str, DbtModel]] = [
+            (
+                model.impact_score if model.guid else 0.0,
+                self._print_model_title(model),
+                model,
+            )
+            for model in models
+        ]
+        blocks.sort(key=itemgetter(0, 1), reverse=True)
 
-        for model in models:
-            if model.guid:
-                element_impact_number, model_text_body = self._print_model(model)
-                total_impact_number = total_impact_number + element_impact_number
-                elements.append((element_impact_number, model_text_body))
-            else:
-                model_text_body = self._print_model_not_found(model)
-                elements.append((0, model_text_body))
+        total_impact_number = sum(
+            len(model.all_unique_downstream_elements) for model in models if model.guid
+        )
+        total_impact_score = sum(block[0] for block in blocks)
 
         header = (
             f"## <img src='{self.select_star_web_url}/icons/logo-ss-sign.svg' width='25' height='25' "
             f"align='center'> Select Star Impact Report\n"
             f"Total Potential Impact: {self.__decide_potential_impact_img_emoji(total_impact_number)} "
             f"**{total_impact_number}** direct downstream objects"
-            f" for the **{len(models)}** changed dbt models.<br/><br/><br/>"
+            f" for the **{len(models)}** changed dbt models,"
+            f" impact score **{total_impact_score:.0f}**.<br/><br/><br/>"
+        )
+
+        note = TRUNCATED_REPORT_NOTE
+        if spill_note:
+            note = f"{note} The full report is in the job summary of the workflow run."
+        note = f"{note}\n"
+
+        for max_rows in MAX_ROWS_STEPS:
+            report = self.__print_report(
+                header,
+                blocks,
+                shared_downstream,
+                shared_guids,
+                note,
+                max_rows,
+                max_chars,
+            )
+            if report is not None:
+                self.truncated = max_rows is not None
+                return report
+
+        # even without tables the report is too long, the last models are left out
+        self.truncated = True
+        return self.__print_report(
+            header,
+            blocks,
+            shared_downstream,
+            shared_guids,
+            note,
+            0,
+            max_chars,
+            cut=True,
         )
 
-        # sort by impact number, descending
-        elements.sort(reverse=True)
+    def __print_report(
+        self,
+        header: str,
+        blocks: list[tuple[float, str, DbtModel]],
+        shared_downstream: list[SharedDownstreamElement] | None,
+        shared_guids: set[str],
+        note: str,
+        max_rows: int | None,
+        max_chars: int | None,
+        cut: bool = False,
+    ) -> str | None:
+        """
+        Writes the report in a buffer, giving up as soon as it is longer than max_chars
+        :param note: the note added at the end of a truncated report
+        :param max_rows: the maximum number of rows per table, None for all of them
+        :param cut: when the report is too long, leave out the last models instead of giving up
+        :return: the report, or None when it is too long and cut isn't set
+        """
+        output = StringIO()
+        output.write(header)
+
+        # the models of a cut report leave room for its footer and its note
+        models_max_chars = max_chars
+        if cut:
+            footer = self.__print_cut_footer(len(blocks))
+            models_max_chars = max_chars - len(footer) - len(note)
+
+        for idx, (_, title, model) in enumerate(blocks):
+            block_start = output.tell()
+            if idx:
+                output.write("\n<br/>")
+            output.write(title)
+            if model.guid:
+                self._print_model(model, output, shared_guids, max_rows)
+            else:
+                self._print_model_not_found(model, output)
 
-        # we use only the text of each element block
-        body = "\n<br/>".join(element[1] for element in elements)
+            if models_max_chars is not None and output.tell() > models_max_chars:
+                if not cut:
+                    return None
+                # the report keeps the models written so far
+                output.seek(block_start)
+                output.truncate()
+                output.write(self.__print_cut_footer(len(blocks) - idx))
+                break
 
-        return f"{header}{body}"
+        if shared_downstream and not cut:
+            output.write("\n<br/>")
+            self._print_shared_downstream(shared_downstream, output, max_rows)
+
+        if max_rows is not None:
+            output.write(note)
+
+        if not cut and max_chars is not None and output.tell() > max_chars:
+            return None
+
+        return output.getvalue()
 
     @staticmethod
-    def __decide_potential_impact_img_emoji(impact_number):
-        return HTML_FOR_WARNING_SIGN if impact_number > 0 else HTML_FOR_WHITE_CHECK_MARK
+    def __print_cut_footer(models_left_out: int) -> str:
+        return f"\n<br/>{models_left_out} more changed dbt models are not in this report.\n"
 
-    def _print_model_not_found(self, model: DbtModel) -> str:
-        lines = [
-            f"<img src='{self.select_star_web_url}/icons/dbt.svg' width='15' height='15' align='center'> "
-            f"{model.filepath.split('.')[0]}\n",
-            "Model not found in Select Star database. This model may be hidden or not ingested.",
-        ]
+    def write_step_summary(
+        self,
+        models: list[DbtModel],
+        shared_downstream: list[SharedDownstreamElement] | None = None,
+    ):
+        """
+        Add the report to the job summary of GitHub Actions, as complete as its size limit allows.
+        It holds the full report when the comment one is truncated.
+        :param models: a list of dbt models
+        :param shared_downstream: optional, the downstream elements affected by more than one model
+        """
+        step_summary_filepath = self.get_step_summary_filepath()
+        if not step_summary_filepath:
+            return
+
+        report = self.print(
+            models=models,
+            shared_downstream=shared_downstream,
+            max_chars=STEP_SUMMARY_MAX_CHARS,
+        )
+        with open(step_summary_filepath, "a") as step_summary_file:
+            step_summary_file.write(f"{report}\n\n")
 
-        return "".join(lines)
+    @staticmethod
+    def get_step_summary_filepath() -> str | None:
+        return os.environ.get("GITHUB_STEP_SUMMARY")
+
+    @staticmethod
+    def __decide_potential_impact_img_emoji(impact_number):
+        return HTML_FOR_WARNING_SIGN if impact_number > 0 else HTML_FOR_WHITE_CHECK_MARK
 
-    def _print_model(self, model: DbtModel) -> (int, str):
+    def _print_model_title(self, model: DbtModel) -> str:
         """
-        Creates the report of a single model.
+        Creates the first line of a model report, with its link and its linked warehouse table
         :param model: a dbt model
-        :return: the text of a single dbt model
+        :return: the title text
         """
-
-        lines = []
+        if not model.guid:
+            return (
+                f"<img src='{self.select_star_web_url}/icons/dbt.svg' width='15' height='15' align='center'> "
+                f"{model.filepath.split('.')[0]}\n"
+            )
 
         model_url = f"{self.select_star_web_url}/tables/{model.guid}/overview"
 
@@ -86,53 +226,261 @@ class ReportPrinter:
         else:
             maps_to = " has no linked warehouse table"
 
-        lines.append(
+        return (
             f"<img src='{self.select_star_web_url}/icons/dbt.svg' width='15' height='15' align='center'> "
             f"[{model.filepath.split('.')[0]}]({model_url}){maps_to}\n"
         )
 
+    @staticmethod
+    def _print_model_not_found(model: DbtModel, output: TextIO):
+        output.write(
+            "Model not found in Select Star database. This model may be hidden or not ingested."
+        )
+
+    def _print_model(
+        self,
+        model: DbtModel,
+        output: TextIO,
+        shared_guids: set[str] | None = None,
+        max_rows: int | None = None,
+    ):
+        """
+        Writes the report of a single model, after its title.
+        :param model: a dbt model
+        :param output: the report buffer
+        :param shared_guids: guids of the elements printed in the shared section, left out of the model table
+        :param max_rows: the maximum number of rows of the table, None for all of them
+        """
         total_impact_number = len(model.all_unique_downstream_elements)
 
+        if model.changed_columns is not None:
+            output.write(self._print_changed_columns(model.changed_columns))
+
         if total_impact_number > 0:
-            lines.append(
-                f"Potential Impact: {HTML_FOR_WARNING_SIGN} {total_impact_number} direct downstream objects.\n"
+            output.write(
+                f"Potential Impact: {HTML_FOR_WARNING_SIGN} {total_impact_number} direct downstream objects,"
+                f" impact score {model.impact_score:.0f}.\n"
             )
         else:
-            lines.append(
+            output.write(
                 f"Potential Impact: {HTML_FOR_WHITE_CHECK_MARK} No direct downstream objects.\n"
             )
 
-        if total_impact_number:
-            lines.append(
-                "| # | Data Source Type | Object Type | Name |\n|--------|--------|--------|--------|\n"
-            )
+        if model.lineage_graph:
+            output.write(self._print_transitive_impact(model.lineage_graph))
 
-            all_downstream_elements = model.all_unique_downstream_elements
+        all_downstream_elements = model.all_unique_downstream_elements
+        if shared_guids:
+            all_downstream_elements = [
+                element
+                for element in all_downstream_elements
+                if element.guid not in shared_guids
+            ]
+            shared_number = total_impact_number - len(all_downstream_elements)
+            if shared_number:
+                output.write(
+                    f"{shared_number} of them are also affected by other changed models,"
+                    f" see the objects affected by multiple models.\n"
+                )
 
-            all_downstream_elements.sort(
-                key=attrgetter("data_source_type", "type", "name")
+        if all_downstream_elements:
+            shown_elements, hidden_elements = self.__pick_top_scored(
+                all_downstream_elements, max_rows
             )
-
-            for idx, model_element in enumerate(all_downstream_elements, start=1):
-                obj_url = (
-                    f"{self.select_star_web_url}/tables/{model_element.guid}/overview"
+            if shown_elements:
+                output.write(
+                    "| # | Data Source Type | Object Type | Name |\n|--------|--------|--------|--------|\n"
                 )
-                if model_element.linked_object_data_source_type:
-                    source_types = (
-                        f"{self._build_datasource_img_tag(model_element.data_source_type)} {model_element.data_source_type} / "
-                        f"{self._build_datasource_img_tag(model_element.linked_object_data_source_type)} {model_element.linked_object_data_source_type}"
+                # by impact score, then by data source type, object type and name
+                shown_elements.sort(key=attrgetter("data_source_type", "type", "name"))
+                shown_elements.sort(key=attrgetter("impact_score"), reverse=True)
+
+                for idx, model_element in enumerate(shown_elements, start=1):
+                    output.write(f"|{idx}")
+                    output.write(
+                        self._print_element_columns(
+                            model_element,
+                            model.linked_object_data_source_types.get(
+                                model_element.guid
+                            ),
+                        )
                     )
-                else:
-                    source_types = f"{self._build_datasource_img_tag(model_element.data_source_type)} {model_element.data_source_type}"
-
-                lines.append(
-                    f"|{idx}"
-                    f"|{source_types}"
-                    f"|{model_element.type}"
-                    f"|[{model_element.name}]({obj_url})|\n"
+                    output.write("|\n")
+
+            if hidden_elements:
+                self._print_hidden_elements(
+                    hidden_elements, output, bool(shown_elements)
+                )
+
+    @staticmethod
+    def __pick_top_scored(
+        elements: list[DownstreamElement], max_rows: int | None
+    ) -> tuple[list[DownstreamElement], list[DownstreamElement]]:
+        """
+        Split the elements in the ones with the highest impact score, up to max_rows, and the other ones
+        :return: the shown elements and the hidden elements
+        """
+        if max_rows is None or len(elements) <= max_rows:
+            return list(elements), []
+
+        by_score = sorted(elements, key=attrgetter("impact_score"), reverse=True)
+        return by_score[:max_rows], by_score[max_rows:]
+
+    def _print_hidden_elements(
+        self, elements: list[DownstreamElement], output: TextIO, some_shown: bool
+    ):
+        """
+        Writes the number of elements left out of a table, per data source and object type, in a collapsed block
+        :param elements: the elements left out
+        :param output: the report buffer
+        :param some_shown: if the elements with the highest impact are in the table above
+        """
+        counts = Counter(
+            (element.data_source_type, element.type) for element in elements
+        )
+        summary = (
+            f"{len(elements)} downstream objects with a lower impact"
+            if some_shown
+            else f"{len(elements)} downstream objects"
+        )
+        output.write(
+            f"<details><summary>{summary}</summary>\n\n"
+            "| Data Source Type | Object Type | Count |\n|--------|--------|--------|\n"
+        )
+        for (data_source_type, object_type), count in sorted(
+            counts.items(), key=lambda item: (-item[1], str(item[0][0]), item[0][1])
+        ):
+            output.write(
+                f"|{self._build_datasource_img_tag(data_source_type)} {data_source_type}|{object_type}|{count}|\n"
+            )
+        output.write("\n</details>\n")
+
+    def _print_element_columns(
+        self,
+        element: DownstreamElement,
+        linked_object_data_source_type: str | None = None,
+    ) -> str:
+        """
+        Creates the data source type, object type and name columns of a downstream element row
+        :param element: a downstream element
+        :param linked_object_data_source_type: optional, the data source type of the linked object merged into the
+         element for the model of the row
+        :return: the columns text, each one starting with a pipe
+        """
+        obj_url = f"{self.select_star_web_url}/tables/{element.guid}/overview"
+        if linked_object_data_source_type:
+            source_types = (
+                f"{self._build_datasource_img_tag(element.data_source_type)} {element.data_source_type} / "
+                f"{self._build_datasource_img_tag(linked_object_data_source_type)} {linked_object_data_source_type}"
+            )
+        else:
+            source_types = f"{self._build_datasource_img_tag(element.data_source_type)} {element.data_source_type}"
+
+        return f"|{source_types}|{element.type}|[{element.name}]({obj_url})"
+
+    def _print_shared_downstream(
+        self,
+        shared_downstream: list[SharedDownstreamElement],
+        output: TextIO,
+        max_rows: int | None = None,
+    ):
+        """
+        Writes the section of the downstream elements affected by more than one model
+        :param shared_downstream: the shared elements
+        :param output: the report buffer
+        :param max_rows: the maximum number of rows of the table, None for all of them
+        """
+        output.write(
+            f"### Objects affected by multiple models\n"
+            f"{len(shared_downstream)} downstream objects are affected by more than one changed dbt model.\n"
+        )
+
+        shown_downstream = shared_downstream
+        hidden_elements = []
+        if max_rows is not None and len(shared_downstream) > max_rows:
+            by_score = sorted(
+                shared_downstream,
+                key=lambda shared_element: shared_element.element.impact_score,
+                reverse=True,
+            )
+            shown_guids = {
+                shared_element.element.guid for shared_element in by_score[:max_rows]
+            }
+            # the shown elements keep their order
+            shown_downstream = [
+                shared_element
+                for shared_element in shared_downstream
+                if shared_element.element.guid in shown_guids
+            ]
+            hidden_elements = [
+                shared_element.element for shared_element in by_score[max_rows:]
+            ]
+
+        if shown_downstream:
+            output.write(
+                "| # | Data Source Type | Object Type | Name | Changed Models |\n"
+                "|--------|--------|--------|--------|--------|\n"
+            )
+
+        for idx, shared_element in enumerate(shown_downstream, start=1):
+            models_names = ", ".join(
+                model.filename.split(".")[0] for model in shared_element.models
+            )
+            output.write(f"|{idx}")
+            # the linked object of the first model whose downstream has one
+            linked_object_data_source_type = next(
+                (
+                    model.linked_object_data_source_types[shared_element.element.guid]
+                    for model in shared_element.models
+                    if shared_element.element.guid
+                    in model.linked_object_data_source_types
+                ),
+                None,
+            )
+            output.write(
+                self._print_element_columns(
+                    shared_element.element, linked_object_data_source_type
                 )
+            )
+            output.write(f"|{models_names}|\n")
+
+        if hidden_elements:
+            self._print_hidden_elements(hidden_elements, output, bool(shown_downstream))
+
+    @staticmethod
+    def _print_transitive_impact(graph: LineageGraph) -> str:
+        """
+        Summarises the downstream graph of a model per depth level
+        :param graph: the model lineage graph
+        :return: the text of the transitive impact
+        """
+        levels = [
+            f"depth {depth}: **{len(elements)}**"
+            for depth, elements in sorted(graph.levels.items())
+            if depth > 1
+        ]
+        if not levels:
+            text = "Transitive Impact: no indirect downstream objects"
+        else:
+            text = f"Transitive Impact: {', '.join(levels)} indirect downstream objects"
+
+        if graph.truncated:
+            text = f"{text} (incomplete, the lineage node budget was reached)"
+
+        return f"{text}.\n"
+
+    @staticmethod
+    def _print_changed_columns(changed_columns: frozenset[str]) -> str:
+        """
+        Lists the output columns touched by the model patch, whose downstream fields are the only ones reported
+        :param changed_columns: the changed columns of the model
+        :return: the text of the changed columns
+        """
+        if not changed_columns:
+            return "Column-level impact: no output column changed.\n"
 
-        return total_impact_number, "".join(lines)
+        columns = ", ".join(f"`{column}`" for column in sorted(changed_columns))
+        return f"Column-level impact of the changed columns {columns}.\n"
 
     def _build_datasource_img_tag(self, data_source_type: str):
         if data_source_type in [
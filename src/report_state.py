@@ -0,0 +1,227 @@
+import base64
+import hashlib
+import json
+import logging
+import re
+import time
+import zlib
+
+from dataobjects import DbtModel, DownstreamElement, LineageGraph, WarehouseLink
+from settings import AppSettings
+
+log = logging.getLogger(__name__)
+
+# the state is a hidden block of the report comment, it must leave room for the report itself
+STATE_MAX_CHARS = 20000
+
+# settings that change the lineage of a model, a previous state with other values is discarded
+FINGERPRINT_SETTINGS = [
+    AppSettings.SELECTSTAR_API_URL,
+    AppSettings.SELECTSTAR_DATASOURCE_GUID,
+    AppSettings.SELECTSTAR_PROJECT_DATASOURCES,
+    AppSettings.SELECTSTAR_LINEAGE_DEPTH,
+    AppSettings.SELECTSTAR_LINEAGE_MODE,
+    AppSettings.SELECTSTAR_LINEAGE_NODE_BUDGET,
+]
+
+
+class ReportState:
+    """
+    Compact state of the last report, embedded in the report comment as a hidden, compressed block.
+    It keeps the git blob SHA and the resolved lineage of every model, so the next run only re-queries
+     the models whose file changed since then.
+    """
+
+    anchor = "<!-- ImpactReportState: "
+    version = 1
+
+    def __init__(self, settings: dict):
+        self.ttl = settings.get(AppSettings.CACHE_TTL)
+        self.fingerprint = hashlib.sha256(
+            json.dumps(
+                [str(settings.get(setting)) for setting in FINGERPRINT_SETTINGS]
+            ).encode()
+        ).hexdigest()[:16]
+        # repository filepath -> model entry
+        self.models: dict[str, dict] = {}
+
+    def load(self, comment_body: str | None):
+        """
+        Load the state embedded in a previous report comment
+        :param comment_body: the body of the previous report comment, if any
+        """
+        if not comment_body:
+            return
+
+        found_block = re.search(
+            rf"{re.escape(self.anchor)}([A-Za-z0-9+/=]+) -->", comment_body
+        )
+        if not found_block:
+            log.info("The previous impact report has no state.")
+            return
+
+        try:
+            state = json.loads(zlib.decompress(base64.b64decode(found_block.group(1))))
+        except (ValueError, zlib.error) as exc:
+            log.warning(
+                f"Unable to read the state of the previous impact report: {exc}"
+            )
+            return
+
+        if (
+            state.get("version") != self.version
+            or state.get("fingerprint") != self.fingerprint
+        ):
+            log.info("The previous impact report was created with other settings.")
+            return
+
+        oldest_allowed = time.time() - self.ttl
+        self.models = {
+            filepath: entry
+            for filepath, entry in state["models"].items()
+            if entry["created_at"] > oldest_allowed
+        }
+        log.info(
+            f"Loaded the state of {len(self.models)} models from the previous impact report."
+        )
+
+    def restore(self, dbt_models: list[DbtModel]) -> list[DbtModel]:
+        """
+        Restore the lineage of the models whose file didn't change since the previous report
+        :param dbt_models: the changed models of the pull request
+        :return: the models that still need to be fetched
+        """
+        models_to_fetch = []
+        for model in dbt_models:
+            entry = self.models.get(model.filepath)
+            if (
+                entry
+                and model.sha
+                and entry["sha"] == model.sha
+                # the patch can change without the file, when the base branch moves
+                and entry.get("columns") == self.__get_columns(model)
+            ):
+                self.__restore_model(model, entry)
+            else:
+                models_to_fetch.append(model)
+
+        log.info(
+            f"{len(dbt_models) - len(models_to_fetch)} models restored from the previous impact report,"
+            f" {len(models_to_fetch)} models to fetch."
+        )
+        return models_to_fetch
+
+    def update(self, dbt_models: list[DbtModel]):
+        """
+        Store the lineage of the given models, replacing the previous state
+        :param dbt_models: the models with their lineage fetched or restored
+        """
+        now = time.time()
+        self.models = {
+            # a restored entry keeps its creation time, so it still expires
+            model.filepath: self.models[model.filepath]
+            if model.restored_from_state
+            else self.__build_entry(model, now)
+            for model in dbt_models
+            # models not found are always fetched again, they may have been ingested meanwhile
+            if model.guid and model.sha
+        }
+
+    def print(self) -> str:
+        """
+        Creates the hidden block of the state. When it's too large, the models with the largest lineage are left out,
+         they will be fetched again on the next run.
+        :return: the text of the hidden block
+        """
+        # the models with the smallest lineage are kept first, the number of kept models is found by bisection
+        filepaths = sorted(
+            self.models, key=lambda filepath: len(self.models[filepath]["downstream"])
+        )
+        encoded_state = self.__encode(filepaths)
+        if len(encoded_state) > STATE_MAX_CHARS:
+            low, high = 0, len(filepaths) - 1
+            encoded_state = self.__encode([])
+            while low < high:
+                middle = (low + high + 1) // 2
+                middle_state = self.__encode(filepaths[:middle])
+                if len(middle_state) <= STATE_MAX_CHARS:
+                    low, encoded_state = middle, middle_state
+                else:
+                    high = middle - 1
+
+        return f"{self.anchor}{encoded_state} -->"
+
+    def __encode(self, filepaths: list[str]) -> str:
+        return base64.b64encode(
+            zlib.compress(
+                json.dumps(
+                    {
+                        "version": self.version,
+                        "fingerprint": self.fingerprint,
+                        "models": {
+                            filepath: self.models[filepath] for filepath in filepaths
+                        },
+                    },
+                    separators=(",", ":"),
+                ).encode(),
+                level=9,
+            )
+        ).decode()
+
+    @staticmethod
+    def __get_columns(model: DbtModel) -> list[str] | None:
+        if model.changed_columns is None:
+            return None
+        return sorted(model.changed_columns)
+
+    @staticmethod
+    def __build_entry(model: DbtModel, now: float) -> dict:
+        entry = {
+            "sha": model.sha,
+            "created_at": now,
+            "guid": model.guid,
+            "columns": ReportState.__get_columns(model),
+            "links": [link.table.to_payload() for link in model.warehouse_links],
+            "downstream": [
+                [
+                    element.to_payload(),
+                    model.linked_object_data_source_types.get(element.guid),
+                ]
+                for element in model.all_unique_downstream_elements
+            ],
+        }
+        if model.lineage_graph:
+            entry["levels"] = {
+                depth: [element.to_payload() for element in elements]
+                for depth, elements in model.lineage_graph.levels.items()
+                if depth > 1
+            }
+            entry["truncated"] = model.lineage_graph.truncated
+        return entry
+
+    @staticmethod
+    def __restore_model(model: DbtModel, entry: dict):
+        model.restored_from_state = True
+        model.guid = entry["guid"]
+        for table in entry["links"]:
+            warehouse_link = WarehouseLink({"warehouse_table": {"guid": table["guid"]}})
+            warehouse_link.set_table(table)
+            model.warehouse_links.append(warehouse_link)
+
+        for payload, linked_object_data_source_type in entry["downstream"]:
+            element = DownstreamElement(payload)
+            if linked_object_data_source_type:
+                model.linked_object_data_source_types[
+                    element.guid
+                ] = linked_object_data_source_type
+            model.all_unique_downstream_elements.append(element)
+
+        if "levels" in entry:
+            model.lineage_graph = LineageGraph()
+            if model.all_unique_downstream_elements:
+                model.lineage_graph.levels[1] = model.all_unique_downstream_elements
+            for depth, payloads in entry["levels"].items():
+                model.lineage_graph.levels[int(depth)] = [
+                    DownstreamElement(payload) for payload in payloads
+                ]
+            model.lineage_graph.truncated = entry["truncated"]
@@ -0,0 +1,76 @@
+import logging
+from itertools import chain
+from math import fsum, log1p
+from operator import attrgetter
+
+from dataobjects import DbtModel, DownstreamElement
+
+log = logging.getLogger(__name__)
+
+# the impact on a BI object reaches its viewers directly
+DATA_SOURCE_TYPE_WEIGHTS = {
+    "looker": 2.0,
+    "tableau": 2.0,
+    "mode": 2.0,
+    "power_bi": 2.0,
+    "sigma": 2.0,
+    "metabase": 2.0,
+    "periscope": 2.0,
+}
+DEFAULT_DATA_SOURCE_TYPE_WEIGHT = 1.0
+# the popularity is a 0-100 score
+POPULARITY_WEIGHT = 1.0 / 100
+USERS_WEIGHT = 0.5
+# each level of the transitive lineage counts half as much as the previous one
+DEPTH_DECAY = 0.5
+
+
+def score_elements(elements: list[DownstreamElement]):
+    """
+    Set the impact score of the given elements:
+     source weight * (1 + popularity weight * popularity + users weight * log(1 + users count))
+    :param elements: unique downstream elements
+    """
+    for element in elements:
+        popularity = element.popularity
+        source_weight = DATA_SOURCE_TYPE_WEIGHTS.get(
+            element.data_source_type, DEFAULT_DATA_SOURCE_TYPE_WEIGHT
+        )
+        if popularity:
+            element.impact_score = source_weight * (
+                1.0
+                + (popularity.popularity or 0) * POPULARITY_WEIGHT
+                + log1p(popularity.users_count) * USERS_WEIGHT
+            )
+        else:
+            element.impact_score = source_weight
+
+
+def score_models(dbt_models: list[DbtModel]):
+    """
+    Compute the impact score of every downstream element of every model in a single batch, then the impact score of
+     each model: the scores of its direct downstream elements plus the decayed scores of its transitive lineage.
+    :param dbt_models: the models with their lineage
+    """
+    # elements are shared between models, each one is scored once
+    elements = {
+        id(element): element
+        for model in dbt_models
+        for element in chain(
+            model.all_unique_downstream_elements,
+            *(model.lineage_graph.levels.values() if model.lineage_graph else ()),
+        )
+    }
+    score_elements(list(elements.values()))
+
+    get_score = attrgetter("impact_score")
+    for model in dbt_models:
+        model.impact_score = fsum(map(get_score, model.all_unique_downstream_elements))
+        if model.lineage_graph:
+            model.impact_score += fsum(
+                DEPTH_DECAY ** (depth - 1) * fsum(map(get_score, level_elements))
+                for depth, level_elements in model.lineage_graph.levels.items()
+                if depth > 1
+            )
+
+    log.info(f"Scored {len(elements)} downstream elements.")
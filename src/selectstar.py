@@ -1,227 +1,1446 @@
 import logging
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from functools import partial
+from itertools import chain, islice
+from urllib.parse import quote
 
+import ijson
 import requests
 
-from dataobjects import DbtModel, DownstreamElement, TableLinked, WarehouseLink
+from cache import ResponseCache
+from dataobjects import (
+    DbtModel,
+    DownstreamElement,
+    LineageGraph,
+    SharedDownstreamElement,
+    TableLinked,
+    WarehouseLink,
+)
 from exceptions import APIException
+from metrics import metrics
 from settings import AppSettings
+from transport import StreamedBody, build_session
 
 log = logging.getLogger(__name__)
 
+GUID_BY_FILENAME_QUERY = "{guid,extra,table_type}"
+GUID_BY_NAME_QUERY = "{guid,full_name}"
+COLUMN_QUERY = "{guid,name}"
+TABLE_DETAIL_QUERY = "{guid,name,data_type,database{guid,name,data_source{guid,name,type}},schema{guid,name}}"
+# the attributes read by WarehouseLink and DownstreamElement, the API returns full objects otherwise
+WAREHOUSE_LINK_QUERY = "{warehouse_table{guid}}"
+DOWNSTREAM_QUERY = (
+    "{guid,name,data_type,full_name,data_source_type,linked_objs,"
+    "popularity{popularity,query_count,view_count,user_count}}"
+)
+# the elements of a lineage batch also list the requested objects they are a downstream of
+DOWNSTREAM_BATCH_QUERY = (
+    "{guid,name,data_type,full_name,data_source_type,linked_objs,"
+    "popularity{popularity,query_count,view_count,user_count},source_guids}"
+)
+# maximum number of tables requested at once
+TABLES_CHUNK_SIZE = 100
+# conservative limit, proxies and servers commonly reject URLs longer than 8KB
+MAX_URL_LENGTH = 4096
+# size of the chunks read from a streamed response body
+STREAM_CHUNK_SIZE = 64 * 1024
+# direct downstream of an object, with the links between the data sources
+LINEAGE_PARAMS = {
+    "dbt_links": True,
+    "direction": "right",
+    "group_by_data_source": True,
+    "include_borderline_edges": True,
+    "looker_db_lineage": True,
+    "looker_view_lineage": True,
+    "max_depth": 1,
+    "mode": "table",
+    "mode_lineage": False,
+    "query": DOWNSTREAM_QUERY,
+    "tableau_table_lineage": True,
+}
+LINEAGE_BATCH_PARAMS = LINEAGE_PARAMS | {"query": DOWNSTREAM_BATCH_QUERY}
+# answers of an API without the multi-GUID lineage endpoint
+LINEAGE_BATCH_UNSUPPORTED_STATUSES = {400, 404, 405, 501}
+
+
+def normalize_path(path: str) -> str:
+    return path.replace("\\", "/").strip("/").lower()
+
+
+def path_suffixes(path: str) -> list[str]:
+    """
+    Get every suffix of the given path, e.g. "a/b/c.sql" -> ["a/b/c.sql", "b/c.sql", "c.sql"]
+    :param path: a file path
+    :return: the normalized path suffixes, from the longest to the shortest
+    """
+    parts = normalize_path(path).split("/")
+    return ["/".join(parts[i:]) for i in range(len(parts))]
+
+
+def chunk_by_url_length(
+    values: list[str], url: str, params: dict, param_name: str, max_items: int
+) -> list[list[str]]:
+    """
+    Split the values in chunks which, joined by commas in a single query parameter, keep the URL under MAX_URL_LENGTH
+    :param values: the values to be split
+    :param url: the request URL
+    :param params: the other query parameters of the request
+    :param param_name: the name of the query parameter that receives the values
+    :param max_items: the maximum number of values per chunk
+    :return: the values chunks
+    """
+    base_length = len(requests.Request("GET", url, params=params).prepare().url) + len(
+        f"&{param_name}=&page_size={max_items}"
+    )
+
+    chunks = []
+    chunk = []
+    chunk_length = base_length
+    for value in values:
+        # the comma separator is encoded as %2C
+        value_length = len(quote(value, safe="")) + 3
+        if chunk and (
+            chunk_length + value_length > MAX_URL_LENGTH or len(chunk) >= max_items
+        ):
+            chunks.append(chunk)
+            chunk = []
+            chunk_length = base_length
+        chunk.append(value)
+        chunk_length += value_length
+    if chunk:
+        chunks.append(chunk)
+
+    return chunks
+
+
+def split_lineage_batch(
+    guids: list[str], found_elements: Iterable[dict]
+) -> Iterator[tuple[str, dict]]:
+    """
+    Split the combined lineage of a batch back per requested object. Every element of a multi-GUID lineage response
+     lists the requested objects it is a direct downstream of in `source_guids`.
+    :param guids: the guids of the requested objects
+    :param found_elements: the elements of the batch lineage response
+    :return: generator of (requested guid, element) pairs, without the requested object itself nor repeated elements
+    """
+    seen_guids = {guid: {guid} for guid in guids}
+    for found_element in found_elements:
+        element_guid = found_element.get("guid")
+        for source_guid in found_element.get("source_guids") or []:
+            source_seen_guids = seen_guids.get(source_guid)
+            if source_seen_guids is not None and element_guid not in source_seen_guids:
+                source_seen_guids.add(element_guid)
+                yield source_guid, found_element
+
+
+def partition_by_datasource(
+    dbt_models: list[DbtModel],
+    project_datasources: dict[str, str],
+    default_datasource_guid: str,
+) -> dict[str, list[DbtModel]]:
+    """
+    Split the models by the datasource of their dbt project. The project of a model is the one with the longest root
+     containing the model file, the models outside of every project belong to the default datasource.
+    :param dbt_models: the changed dbt models
+    :param project_datasources: the datasource GUID by project root, relative to the repository
+    :param default_datasource_guid: the datasource of the models outside of every project
+    :return: the models by datasource GUID
+    """
+    # the longest roots first, so a nested project wins over its parent
+    project_roots = sorted(
+        ((normalize_path(root), guid) for root, guid in project_datasources.items()),
+        key=lambda project_root: len(project_root[0]),
+        reverse=True,
+    )
+
+    models_by_datasource: dict[str, list[DbtModel]] = {}
+    for model in dbt_models:
+        filepath = normalize_path(model.filepath)
+        datasource_guid = next(
+            (
+                guid
+                for root, guid in project_roots
+                if not root or filepath.startswith(f"{root}/")
+            ),
+            default_datasource_guid,
+        )
+        models_by_datasource.setdefault(datasource_guid, []).append(model)
+
+    return models_by_datasource
+
 
 class SelectStar:
     """
     Select Star API interface.
     """
 
-    def __init__(self, settings: dict):
+    def __init__(self, settings: dict, cache: ResponseCache | None = None):
+        """
+        :param settings: the app settings
+        :param cache: a response cache shared with other instances, closed by its owner. By default the cache
+         described by the settings is opened, and closed with this instance.
+        """
         self.settings = settings
-        self.session = requests.Session()
-        self.session.headers.update(
-            {
+        self.api_url = settings.get(AppSettings.SELECTSTAR_API_URL)
+        self.datasource_guid = settings.get(AppSettings.SELECTSTAR_DATASOURCE_GUID)
+        self.max_concurrency = settings.get(AppSettings.SELECTSTAR_MAX_CONCURRENCY)
+        self.session = build_session(
+            settings=settings,
+            pool_size=self.max_concurrency,
+            headers={
                 "Authorization": f"Token {settings.get(AppSettings.SELECTSTAR_API_TOKEN)}",
                 "User-Agent": "Select Star Dbt Impact Report",
-            }
+            },
         )
-        self.api_url = settings.get(AppSettings.SELECTSTAR_API_URL)
-        self.datasource_guid = settings.get(AppSettings.SELECTSTAR_DATASOURCE_GUID)
+        self.lineage_depth = settings.get(AppSettings.SELECTSTAR_LINEAGE_DEPTH)
+        self.lineage_node_budget = settings.get(
+            AppSettings.SELECTSTAR_LINEAGE_NODE_BUDGET
+        )
+        self.lineage_batch_size = settings.get(
+            AppSettings.SELECTSTAR_LINEAGE_BATCH_SIZE
+        )
+        # turned off by the first lineage batch refused by the API
+        self.lineage_batch_supported = self.lineage_batch_size > 1
+        # the requests of the models overlap, instead of running in sequential phases
+        self.pipeline = settings.get(AppSettings.SELECTSTAR_PIPELINE)
+        self.owns_cache = cache is None
+        self.cache = ResponseCache.from_settings(settings) if cache is None else cache
+        # downstream elements by guid, fetched once per run
+        self.downstream_by_guid: dict[str, list[DownstreamElement]] = {}
+        # in column mode: downstream fields by column guid, and merged downstream by table guid and changed columns
+        self.downstream_by_column: dict[str, list[DownstreamElement]] = {}
+        self.columns_downstream: dict[
+            tuple[str, frozenset[str]], list[DownstreamElement]
+        ] = {}
+        # the table guid and changed columns whose columns aren't all found on the table
+        self.columns_not_found: set[tuple[str, frozenset[str]]] = set()
 
-    def __get_tables_guids(self, dbt_models: list[DbtModel]):
+    def close(self):
         """
-        Populates the GUID for each given dbt_model using its filename
-        :param dbt_models: list of dbt models to fetch its GUID
+        Release the resources held by this interface, saving the response cache
         """
+        self.session.close()
+        if self.cache and self.owns_cache:
+            self.cache.close()
 
-        page_size = 10
-        url = f"{self.api_url}/v1/tables/"
+    def __get_json(
+        self, endpoint: str, guid: str, url: str, params: dict | None = None
+    ) -> dict:
+        """
+        Get the JSON response of the given URL, reading and populating the response cache
+        :param endpoint: the endpoint name, part of the cache key
+        :param guid: the guid of the requested object, part of the cache key
+        :param url: the URL to be requested
+        :param params: the query parameters
+        :return: the data returned by the API
+        """
+        cache_key = ResponseCache.build_key(endpoint, guid, params)
+        if self.cache:
+            cached_data = self.cache.get(cache_key)
+            if cached_data is not None:
+                return cached_data
 
-        for i in range(0, len(dbt_models), page_size):
-            a_slice = dbt_models[i : i + page_size]
-            slice_str = ",".join(
-                dbt_model.project_relative_filepath for dbt_model in a_slice
-            )
-            log.info(
-                f"  Fetching GUID for the models: '{slice_str}' {self.datasource_guid=}"
-            )
-            params = {
-                "query": "{guid,extra,table_type}",
-                "filenames": slice_str,
-                "datasources": self.datasource_guid,
-            }
-            response = self.session.get(url, params=params)
+        response = self.session.get(url, params=params)
+
+        if response.status_code != 200:
+            raise APIException(response=response)
 
+        data = response.json()
+        if self.cache:
+            self.cache.set(cache_key, data)
+
+        return data
+
+    def __get_all_results(self, url: str, params: dict) -> list[dict]:
+        """
+        Get the results of every page of a list request, following the `next` links
+        :param url: the URL of the first page
+        :param params: the query parameters of the first page, the next links carry them
+        :return: the results of all the pages
+        """
+        results = []
+        while url:
+            response = self.session.get(url, params=params)
             if response.status_code != 200:
                 raise APIException(response=response)
 
-            tables = response.json()["results"]
+            data = response.json()
+            results.extend(data["results"])
+            url, params = data.get("next"), None
 
-            for dbt_model in a_slice:
-                for table in tables:
-                    if dbt_model.filename in table["extra"]["path"]:
-                        dbt_model.guid = table["guid"]
-                        continue
+        return results
 
-    def __get_table(self, guid: str) -> dict:
+    def __chunk_models(
+        self,
+        dbt_models: list[DbtModel],
+        values: list[str],
+        params: dict,
+        param_name: str,
+    ) -> list[list[DbtModel]]:
         """
-        Get the data for the given table GUID
-        :param guid: table's guid
-        :return: the data returned by the API
+        Split the models in chunks whose lookup values are sent in a single tables request
+        :param dbt_models: the models to be looked up
+        :param values: the lookup value of each model, in the same order
+        :param params: the other query parameters of the request
+        :param param_name: the name of the query parameter that receives the values
+        :return: the models chunks
         """
-        url = f"{self.api_url}/v1/tables/{guid}/"
-        params = {
-            "query": f"{{guid,name,data_type,database{{guid,name,data_source{{guid,name,type}}}},schema{{guid,name}}}}"
-        }
-        response = self.session.get(url, params=params)
+        chunks = chunk_by_url_length(
+            values=values,
+            url=f"{self.api_url}/v1/tables/",
+            params=params,
+            param_name=param_name,
+            max_items=TABLES_CHUNK_SIZE,
+        )
+        models = iter(dbt_models)
 
-        if response.status_code == 404:
-            return None
-        elif response.status_code != 200:
+        return [list(islice(models, len(chunk))) for chunk in chunks]
+
+    def __chunk_models_by_filename(
+        self, dbt_models: list[DbtModel]
+    ) -> list[list[DbtModel]]:
+        return self.__chunk_models(
+            dbt_models=dbt_models,
+            values=[dbt_model.lookup_filepath for dbt_model in dbt_models],
+            params={
+                "query": GUID_BY_FILENAME_QUERY,
+                "datasources": self.datasource_guid,
+            },
+            param_name="filenames",
+        )
+
+    def __chunk_models_by_name(
+        self, dbt_models: list[DbtModel]
+    ) -> list[list[DbtModel]]:
+        return self.__chunk_models(
+            dbt_models=dbt_models,
+            values=[dbt_model.full_name for dbt_model in dbt_models],
+            params={"query": GUID_BY_NAME_QUERY, "datasources": self.datasource_guid},
+            param_name="full_names",
+        )
+
+    def __get_chunk_guids(self, dbt_models: list[DbtModel]):
+        """
+        Populates the GUID for each given dbt_model using its filename, or its previous filename when it was renamed.
+        Every model is matched exactly against an index of the found tables paths, a path matching several tables
+         is left without GUID.
+        :param dbt_models: a chunk of dbt models, their filenames are sent together. The filenames filter can match
+         more tables than models, every page of the results is read.
+        """
+        slice_str = ",".join(dbt_model.lookup_filepath for dbt_model in dbt_models)
+        log.info(
+            f"  Fetching GUID for the models: '{slice_str}' {self.datasource_guid=}"
+        )
+        found_tables = self.__get_all_results(
+            f"{self.api_url}/v1/tables/",
+            params={
+                "query": GUID_BY_FILENAME_QUERY,
+                "datasources": self.datasource_guid,
+                "filenames": slice_str,
+                "page_size": TABLES_CHUNK_SIZE,
+            },
+        )
+
+        # normalized path suffix -> the tables ending with it, by guid
+        tables_index: dict[str, dict[str, dict]] = {}
+        for table in found_tables:
+            for suffix in path_suffixes(table["extra"]["path"]):
+                tables_index.setdefault(suffix, {})[table["guid"]] = table
+
+        for dbt_model in dbt_models:
+            filepath = normalize_path(dbt_model.lookup_filepath)
+            tables = tables_index.get(filepath, {})
+            if len(tables) > 1:
+                # a table with the same path wins over the ones only ending with it
+                tables = {
+                    guid: table
+                    for guid, table in tables.items()
+                    if normalize_path(table["extra"]["path"]) == filepath
+                } or tables
+            if not tables:
+                # e.g. a model moved to another directory, found by its filename when no other table has it
+                tables = tables_index.get(filepath.split("/")[-1], {})
+                if len(tables) == 1:
+                    log.info(
+                        f"  Model {dbt_model.lookup_filepath} found by its filename only"
+                    )
+            if len(tables) == 1:
+                dbt_model.guid = next(iter(tables))
+            elif tables:
+                log.warning(
+                    f"Model {dbt_model.lookup_filepath} matches {len(tables)} tables. Skipping."
+                )
+
+    def __get_chunk_guids_by_name(self, dbt_models: list[DbtModel]):
+        """
+        Populates the GUID for each given dbt_model using its fully-qualified name, read from the dbt manifest.
+        :param dbt_models: a chunk of dbt models with a full name, their names are sent in a single request
+        """
+        log.info(f"  Fetching GUID for {len(dbt_models)} models by full name")
+        response = self.session.get(
+            f"{self.api_url}/v1/tables/",
+            params={
+                "query": GUID_BY_NAME_QUERY,
+                "datasources": self.datasource_guid,
+                "full_names": ",".join(dbt_model.full_name for dbt_model in dbt_models),
+                "page_size": len(dbt_models),
+            },
+        )
+
+        if response.status_code != 200:
+            raise APIException(response=response)
+
+        # lowercase full name -> table guid
+        guids_by_name: dict[str, str] = {}
+        for table in response.json()["results"]:
+            guids_by_name.setdefault(table["full_name"].lower(), table["guid"])
+
+        for dbt_model in dbt_models:
+            dbt_model.guid = guids_by_name.get(dbt_model.full_name.lower())
+
+    def __get_tables_guids(self, dbt_models: list[DbtModel]):
+        """
+        Populates the GUID for each given dbt_model, by full name when it was read from the dbt manifest, then by
+         filename for the remaining ones.
+        The lookup values are sent in as few requests as the URL length allows.
+        :param dbt_models: list of dbt models to fetch its GUID
+        """
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            named_models = [model for model in dbt_models if model.full_name]
+            list(
+                executor.map(
+                    self.__get_chunk_guids_by_name,
+                    self.__chunk_models_by_name(named_models),
+                )
+            )
+            # the models missing from the manifest or not found by name fall back to the filename lookup
+            list(
+                executor.map(
+                    self.__get_chunk_guids,
+                    self.__chunk_models_by_filename(
+                        [model for model in dbt_models if not model.guid]
+                    ),
+                )
+            )
+
+    def __chunk_missing_tables(
+        self, guids: list[str]
+    ) -> tuple[dict[str, dict], list[list[str]]]:
+        """
+        Read the given tables from the response cache, and split the other ones in chunks as large as the URL length
+         allows
+        :param guids: tables' guids
+        :return: the cached tables indexed by table GUID, and the chunks of guids to be fetched
+        """
+        found_tables = {}
+
+        if self.cache:
+            missing_guids = []
+            for guid in guids:
+                cached_table = self.cache.get(
+                    ResponseCache.build_key(
+                        "tables", guid, {"query": TABLE_DETAIL_QUERY}
+                    )
+                )
+                if cached_table is not None:
+                    found_tables[guid] = cached_table
+                else:
+                    missing_guids.append(guid)
+            guids = missing_guids
+
+        chunks = chunk_by_url_length(
+            values=guids,
+            url=f"{self.api_url}/v1/tables/",
+            params={"query": TABLE_DETAIL_QUERY},
+            param_name="guids",
+            max_items=TABLES_CHUNK_SIZE,
+        )
+
+        return found_tables, chunks
+
+    def __fetch_tables(self, guids: list[str]) -> dict[str, dict]:
+        """
+        Fetch the data for the given table GUIDs in a single request, and cache it
+        :param guids: tables' guids, a chunk fitting in the URL length
+        :return: the data returned by the API, indexed by table GUID. Tables not found are not included.
+        """
+        response = self.session.get(
+            f"{self.api_url}/v1/tables/",
+            params={
+                "query": TABLE_DETAIL_QUERY,
+                "guids": ",".join(guids),
+                "page_size": len(guids),
+            },
+        )
+
+        if response.status_code != 200:
             raise APIException(response=response)
 
-        return response.json()
+        found_tables = {}
+        for table in response.json()["results"]:
+            found_tables[table["guid"]] = table
+            if self.cache:
+                self.cache.set(
+                    ResponseCache.build_key(
+                        "tables", table["guid"], {"query": TABLE_DETAIL_QUERY}
+                    ),
+                    table,
+                )
+
+        return found_tables
+
+    def __get_tables_chunk(self, guids: list[str]) -> dict[str, dict]:
+        """
+        Get the data for a chunk of table GUIDs in the calling thread, used as a single task of the pipeline
+        :param guids: at most TABLES_CHUNK_SIZE tables' guids, usually fetched in a single request
+        :return: the data returned by the API, indexed by table GUID. Tables not found are not included.
+        """
+        found_tables, chunks = self.__chunk_missing_tables(guids)
+        for chunk in chunks:
+            found_tables.update(self.__fetch_tables(chunk))
+
+        return found_tables
+
+    def __get_tables(self, guids: list[str]) -> dict[str, dict]:
+        """
+        Get the data for the given table GUIDs, the chunks as large as the URL length allows are fetched concurrently
+        :param guids: tables' guids
+        :return: the data returned by the API, indexed by table GUID. Tables not found are not included.
+        """
+        found_tables, chunks = self.__chunk_missing_tables(guids)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            for tables in executor.map(self.__fetch_tables, chunks):
+                found_tables.update(tables)
+
+        return found_tables
+
+    def __get_model_warehouse_links(self, model: DbtModel) -> list[WarehouseLink]:
+        """
+        Get the warehouse-link list of the given dbt model, without its tables
+        :param model: a dbt model
+        :return: the model warehouse links
+        """
+        log.info(f"  Fetching warehouse links for {model.guid=} {model.filename=}")
+
+        url = f"{self.api_url}/v1/dbt/warehouse-link/{model.guid}/"
+        found_links = self.__get_json(
+            "dbt/warehouse-link", model.guid, url, {"query": WAREHOUSE_LINK_QUERY}
+        )
+
+        return [WarehouseLink(link) for link in found_links["results"]]
 
     def __get_warehouse_links(self, dbt_models: list[DbtModel]):
         """
-        Get the warehouse-link for each given dbt model
+        Get the warehouse-link for each given dbt model.
+        The linked tables of all models are collected first and resolved in batches, instead of one request per link.
         :param dbt_models: a list of dbt models
         """
+        models = [model for model in dbt_models if model.guid]
 
-        for model in dbt_models:
-            if not model.guid:
-                continue
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            models_links = list(executor.map(self.__get_model_warehouse_links, models))
+
+        # dict keys keep the links order while removing duplicated tables
+        table_guids = list(
+            {link.guid: None for links in models_links for link in links}
+        )
+        log.info(f"  Fetching {len(table_guids)} warehouse linked tables")
+        found_tables = self.__get_tables(table_guids)
+
+        for model, links in zip(models, models_links):
+            self.__set_warehouse_links(model, links, found_tables)
+
+    @staticmethod
+    def __set_warehouse_links(
+        model: DbtModel, links: list[WarehouseLink], found_tables: dict[str, dict]
+    ):
+        """
+        Keep the warehouse links of the given model whose table was found
+        :param model: a dbt model
+        :param links: the model warehouse links, without their tables
+        :param found_tables: the linked tables data, indexed by table GUID
+        """
+        for warehouse_link in links:
+            found_table = found_tables.get(warehouse_link.guid)
+            if found_table:
+                warehouse_link.set_table(found_table)
+                model.warehouse_links.append(warehouse_link)
+            else:
+                log.warning(
+                    f"   A warehouse link was found, but the target DWH table was not found."
+                    f" Was it removed/deactivated? Missing table guid = {warehouse_link.guid}"
+                )
+
+    def __get_cached_downstream(
+        self, guid: str, mode: str = "table"
+    ) -> list[DownstreamElement] | None:
+        if not self.cache:
+            return None
+
+        cached_data = self.cache.get(
+            ResponseCache.build_key("lineage", guid, LINEAGE_PARAMS | {"mode": mode})
+        )
+        if cached_data is None:
+            return None
 
-            log.info(f"  Fetching warehouse links for {model.guid=} {model.filename=}")
+        return list(self.__iter_unique_downstream(guid, cached_data["table_lineage"]))
 
-            url = f"{self.api_url}/v1/dbt/warehouse-link/{model.guid}/"
-            response = self.session.get(url)
+    def __cache_downstream(
+        self, guid: str, downstream: list[DownstreamElement], mode: str = "table"
+    ):
+        if self.cache:
+            # only the extracted attributes are stored, not the full response
+            self.cache.set(
+                ResponseCache.build_key(
+                    "lineage", guid, LINEAGE_PARAMS | {"mode": mode}
+                ),
+                {"table_lineage": [element.to_payload() for element in downstream]},
+            )
 
+    def __get_downstream(
+        self, guid: str, mode: str = "table"
+    ) -> list[DownstreamElement]:
+        """
+        Get the direct downstream elements of the given object
+        :param guid: the guid of a dbt model, a table or any downstream element, or of a column in column mode
+        :param mode: the lineage mode, "table" or "column"
+        :return: the downstream elements, without the object itself
+        """
+        downstream = self.__get_cached_downstream(guid, mode)
+        if downstream is None:
+            downstream = self.__request_downstream(guid, mode)
+            self.__cache_downstream(guid, downstream, mode)
+
+        return downstream
+
+    def __request_downstream(
+        self, guid: str, mode: str = "table"
+    ) -> list[DownstreamElement]:
+        log.info(f"  Fetching {mode} lineage for {guid=}")
+
+        with self.session.get(
+            f"{self.api_url}/v1/lineage/{guid}/",
+            params=LINEAGE_PARAMS | {"mode": mode},
+            stream=True,
+        ) as response:
             if response.status_code != 200:
                 raise APIException(response=response)
 
-            found_links = response.json()
+            # the body is decoded while it is read, the whole payload is never held in memory
+            return list(
+                self.__iter_unique_downstream(
+                    guid,
+                    ijson.items(
+                        StreamedBody(response),
+                        f"{mode}_lineage.item",
+                        use_float=True,
+                        buf_size=STREAM_CHUNK_SIZE,
+                    ),
+                )
+            )
 
-            for link in found_links["results"]:
-                warehouse_link = WarehouseLink(link)
-                found_table = self.__get_table(warehouse_link.guid)
-                if found_table:
-                    warehouse_link.set_table(found_table)
-                    model.warehouse_links.append(warehouse_link)
-                else:
-                    log.warning(
-                        f"   A warehouse link was found, but the target DWH table was not found."
-                        f" Was it removed/deactivated? Missing table guid = {warehouse_link.guid}"
-                    )
+    def __get_column_downstream(self, column_guid: str) -> list[DownstreamElement]:
+        return self.__get_downstream(column_guid, mode="column")
+
+    def __get_column_guids(
+        self, table_guid: str, columns: frozenset[str]
+    ) -> list[str] | None:
+        """
+        Get the GUIDs of the given columns of a table
+        :param table_guid: the guid of a dbt model or a table
+        :param columns: the lowercase column names
+        :return: the GUIDs of the columns, or None when some columns aren't found on the table
+        """
+        if not columns:
+            return []
+
+        log.info(f"  Fetching the GUID of {len(columns)} columns of {table_guid=}")
+        found_columns = self.__get_json(
+            "columns",
+            table_guid,
+            f"{self.api_url}/v1/columns/",
+            params={
+                "query": COLUMN_QUERY,
+                "tables": table_guid,
+                "names": ",".join(sorted(columns)),
+                "page_size": len(columns),
+            },
+        )
 
-    def __get_element_lineage(self, element: DbtModel | TableLinked):
-        """
-        Get the lineage for the given element
-        :param element: a dbt model or a table linked (warehouse link)
-        """
-        url = f"{self.api_url}/v1/lineage/{element.guid}/"
-        params = {
-            "dbt_links": True,
-            "direction": "right",
-            "group_by_data_source": True,
-            "include_borderline_edges": True,
-            "looker_db_lineage": True,
-            "looker_view_lineage": True,
-            "max_depth": 1,
-            "mode": "table",
-            "mode_lineage": False,
-            "tableau_table_lineage": True,
+        missing_columns = columns - {
+            column["name"].lower() for column in found_columns["results"]
         }
+        if missing_columns:
+            # e.g. a column changed in a CTE, that isn't an output column of the model
+            log.info(
+                f"  Changed columns {sorted(missing_columns)} not found on {table_guid=}"
+            )
+            return None
 
-        log.info(f"  Fetching lineage for {element.guid=}")
+        return [column["guid"] for column in found_columns["results"]]
 
-        response = self.session.get(url, params=params)
+    def __merge_columns_downstream(
+        self, column_guids: list[str]
+    ) -> list[DownstreamElement]:
+        # a field downstream of several changed columns is listed once
+        downstream: dict[str, DownstreamElement] = {}
+        for column_guid in column_guids:
+            for element in self.downstream_by_column[column_guid]:
+                downstream.setdefault(element.guid, element)
 
-        if response.status_code != 200:
-            raise APIException(response=response)
+        return list(downstream.values())
+
+    def __fetch_columns_downstream(self, keys: list[tuple[str, frozenset[str]]]):
+        """
+        Fetch concurrently the downstream of the changed columns of the given tables. The columns are looked up
+         first, then the lineage of every column is fetched once, even when several tables share it.
+        :param keys: the tables guids with their changed columns
+        """
+        missing_keys = list(
+            {key: None for key in keys if key not in self.columns_downstream}
+        )
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            keys_column_guids = list(
+                executor.map(self.__get_column_guids, *zip(*missing_keys))
+                if missing_keys
+                else []
+            )
+            missing_column_guids = list(
+                {
+                    column_guid: None
+                    for column_guids in keys_column_guids
+                    if column_guids is not None
+                    for column_guid in column_guids
+                    if column_guid not in self.downstream_by_column
+                }
+            )
+            for column_guid, downstream in zip(
+                missing_column_guids,
+                executor.map(self.__get_column_downstream, missing_column_guids),
+            ):
+                self.downstream_by_column[column_guid] = downstream
 
-        found_elements = response.json()["table_lineage"]
+        for key, column_guids in zip(missing_keys, keys_column_guids):
+            if column_guids is None:
+                self.columns_not_found.add(key)
+            else:
+                self.columns_downstream[key] = self.__merge_columns_downstream(
+                    column_guids
+                )
 
+    @staticmethod
+    def __fall_back_to_table_lineage(model: DbtModel):
+        """
+        Switch a model to the table-level lineage, when its changed columns aren't all found on its tables
+        :param model: a dbt model in column mode
+        """
+        log.info(
+            f"  The changed columns of {model.filename=} aren't all found, using the table-level lineage"
+        )
+        model.changed_columns = None
+
+    def __get_fetched_downstream(
+        self, model: DbtModel, guid: str
+    ) -> list[DownstreamElement] | None:
+        """
+        Get the fetched downstream of a model or one of its linked tables, restricted to the changed columns of the
+         model in column mode
+        :param model: a dbt model
+        :param guid: the guid of the model or of one of its linked tables
+        :return: the downstream elements, or None when they are not fetched yet
+        """
+        if model.changed_columns is None:
+            return self.downstream_by_guid.get(guid)
+        return self.columns_downstream.get((guid, model.changed_columns))
+
+    def __request_downstream_batch(
+        self, guids: list[str]
+    ) -> dict[str, list[DownstreamElement]] | None:
+        """
+        Get the direct downstream elements of several objects with a single multi-GUID lineage request
+        :param guids: the guids of the objects
+        :return: the downstream elements by guid, or None when the API doesn't support lineage batches
+        """
+        log.info(f"  Fetching lineage for a batch of {len(guids)} objects")
+
+        with self.session.get(
+            f"{self.api_url}/v1/lineage/",
+            params=LINEAGE_BATCH_PARAMS | {"guids": ",".join(guids)},
+            stream=True,
+        ) as response:
+            if response.status_code in LINEAGE_BATCH_UNSUPPORTED_STATUSES:
+                self.__disable_lineage_batches(f"code {response.status_code}")
+                return None
+            if response.status_code != 200:
+                raise APIException(response=response)
+
+            found_elements = ijson.items(
+                StreamedBody(response),
+                "table_lineage.item",
+                use_float=True,
+                buf_size=STREAM_CHUNK_SIZE,
+            )
+            # an API ignoring the guids parameter answers the lineage of a single object, without source_guids
+            first_element = next(found_elements, None)
+            if first_element is not None and "source_guids" not in first_element:
+                self.__disable_lineage_batches("no source_guids in the response")
+                return None
+
+            downstream_by_guid: dict[str, list[DownstreamElement]] = {
+                guid: [] for guid in guids
+            }
+            for guid, found_element in split_lineage_batch(
+                guids,
+                chain([first_element] if first_element else [], found_elements),
+            ):
+                downstream_by_guid[guid].append(DownstreamElement(found_element))
+
+        return downstream_by_guid
+
+    def __disable_lineage_batches(self, reason: str):
+        if self.lineage_batch_supported:
+            log.info(
+                f" The lineage batches are not supported ({reason}),"
+                " the lineage is fetched one object at a time."
+            )
+        self.lineage_batch_supported = False
+
+    def __get_downstream_batch(
+        self, guids: list[str]
+    ) -> dict[str, list[DownstreamElement]]:
+        """
+        Get the direct downstream elements of several objects, in a single request when the API supports lineage
+         batches, otherwise with one request per object, sent in sequence
+        :param guids: the guids of the objects
+        :return: the downstream elements by guid, without the objects themselves
+        """
+        downstream_by_guid: dict[str, list[DownstreamElement]] = {}
+        missing_guids = []
+        for guid in guids:
+            downstream = self.__get_cached_downstream(guid)
+            if downstream is None:
+                missing_guids.append(guid)
+            else:
+                downstream_by_guid[guid] = downstream
+
+        fetched_downstream = None
+        if len(missing_guids) > 1 and self.lineage_batch_supported:
+            fetched_downstream = self.__request_downstream_batch(missing_guids)
+        if fetched_downstream is None:
+            # this already runs on a worker of the caller, the requests are sent in sequence to keep the concurrency
+            #  under SELECTSTAR_MAX_CONCURRENCY
+            fetched_downstream = {
+                guid: self.__request_downstream(guid) for guid in missing_guids
+            }
+
+        for guid, downstream in fetched_downstream.items():
+            self.__cache_downstream(guid, downstream)
+            downstream_by_guid[guid] = downstream
+
+        return downstream_by_guid
+
+    def __chunk_lineage_guids(self, guids: list[str]) -> list[list[str]]:
+        return chunk_by_url_length(
+            values=guids,
+            url=f"{self.api_url}/v1/lineage/",
+            params=LINEAGE_BATCH_PARAMS,
+            param_name="guids",
+            max_items=self.lineage_batch_size,
+        )
+
+    @staticmethod
+    def __iter_unique_downstream(
+        guid: str, found_elements: Iterable[dict]
+    ) -> Iterator[DownstreamElement]:
+        """
+        Yields the downstream elements as they are decoded, without the object itself nor repeated elements
+        :param guid: the guid of the object whose lineage was requested
+        :param found_elements: the elements of the lineage response
+        :return: downstream elements generator
+        """
+        seen_guids = {guid}
         for found_element in found_elements:
-            if found_element.get("guid") != element.guid:
-                element.downstream_elements.append(DownstreamElement(found_element))
+            element_guid = found_element.get("guid")
+            if element_guid not in seen_guids:
+                seen_guids.add(element_guid)
+                yield DownstreamElement(found_element)
+
+    def __fetch_downstream(self, guids: list[str]) -> int:
+        """
+        Fetch concurrently the downstream of the given GUIDs, skipping the ones already fetched in this run.
+        The GUIDs are sent in lineage batches when the API supports them.
+        :param guids: the guids of the objects
+        :return: the number of fetched objects
+        """
+        missing_guids = list(
+            {guid: None for guid in guids if guid not in self.downstream_by_guid}
+        )
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            if self.lineage_batch_size > 1 and self.lineage_batch_supported:
+                for downstream_by_guid in executor.map(
+                    self.__get_downstream_batch,
+                    self.__chunk_lineage_guids(missing_guids),
+                ):
+                    self.downstream_by_guid.update(downstream_by_guid)
+            else:
+                for guid, downstream in zip(
+                    missing_guids, executor.map(self.__get_downstream, missing_guids)
+                ):
+                    self.downstream_by_guid[guid] = downstream
+
+        return len(missing_guids)
 
     def __get_full_lineage(self, dbt_models: list[DbtModel]):
         """
-        Get lineage for all dbt models and their related warehouse links
+        Get lineage for all dbt models and their related warehouse links.
+        Each GUID is fetched once, even when several models link to the same table, and the downstream lists are
+         filled in the models order afterwards, so the result order is the same as a sequential run.
+        :param dbt_models: list of dbt models
+        """
+        models = [model for model in dbt_models if model.guid]
+        self.__fetch_columns_downstream(
+            [
+                (element.guid, model.changed_columns)
+                for model in models
+                if model.changed_columns is not None
+                for element in chain(
+                    [model], (link.table for link in model.warehouse_links)
+                )
+            ]
+        )
+        for model in models:
+            if model.changed_columns is not None and any(
+                (element.guid, model.changed_columns) in self.columns_not_found
+                for element in chain(
+                    [model], (link.table for link in model.warehouse_links)
+                )
+            ):
+                self.__fall_back_to_table_lineage(model)
+        self.__fetch_downstream(
+            [
+                element.guid
+                for model in models
+                if model.changed_columns is None
+                for element in chain(
+                    [model], (link.table for link in model.warehouse_links)
+                )
+            ]
+        )
+
+        for model in models:
+            self.__fill_downstream(model)
+
+    def __fill_downstream(self, model: DbtModel):
+        """
+        Fill the downstream lists of the given model and its linked tables from the fetched lineage
+        :param model: a dbt model with a GUID, whose lineage and linked tables lineage were fetched
+        """
+        elements: list[DbtModel | TableLinked] = [model]
+        elements.extend(link.table for link in model.warehouse_links)
+        for element in elements:
+            element.downstream_elements.extend(
+                self.__get_fetched_downstream(model, element.guid)
+            )
+
+    def __deduplicate_downstream(self, dbt_models: list[DbtModel]):
+        """
+        Checks both the dbt model downstream list and all its warehouse links downstream lists for duplicates
+         between them, creating a single, unique, downstream.
+        dbt elements have priority over their links, other elements linked to an already picked element only mark it
+         with their data source type. The same element instance is shared by every model that reaches it.
         :param dbt_models: list of dbt models
         """
+        # guid -> element instance shared by all models
+        shared_elements: dict[str, DownstreamElement] = {}
         for model in dbt_models:
-            if not model.guid:
+            self.__deduplicate_model_downstream(model, shared_elements)
+
+    @staticmethod
+    def __deduplicate_model_downstream(
+        model: DbtModel, shared_elements: dict[str, DownstreamElement]
+    ):
+        """
+        Creates the unique downstream of a single dbt model, see __deduplicate_downstream
+        :param model: a dbt model, with the downstream of itself and its warehouse links
+        :param shared_elements: the element instances already picked for the previous models, indexed by GUID
+        """
+        # we merge the downstream elements from the dbt model and its warehouse links
+        all_downstream_elements = chain(
+            model.downstream_elements,
+            *(link.table.downstream_elements for link in model.warehouse_links),
+        )
+
+        unique_downstream_elements: dict[str, DownstreamElement] = {}
+        # linked object guid -> the dbt element it is linked to
+        linked_objects_index: dict[str, DownstreamElement] = {}
+        other_elements: list[DownstreamElement] = []
+
+        # first we pick the dbt elements, the other ones are kept aside
+        for downstream_element in all_downstream_elements:
+            if downstream_element.data_source_type != "dbt":
+                other_elements.append(downstream_element)
+            elif downstream_element.guid not in unique_downstream_elements:
+                downstream_element = shared_elements.setdefault(
+                    downstream_element.guid, downstream_element
+                )
+                unique_downstream_elements[downstream_element.guid] = downstream_element
+                for linked_obj in downstream_element.linked_objects:
+                    linked_objects_index.setdefault(linked_obj, downstream_element)
+
+        # second we pick the other data source type elements which aren't linked to an element already picked
+        for downstream_element in other_elements:
+            if downstream_element.guid in unique_downstream_elements:
                 continue
-            self.__get_element_lineage(model)
-            for link in model.warehouse_links:
-                self.__get_element_lineage(link.table)
 
-    def __deduplicate_downstream(self, dbt_models: list[DbtModel]):
+            linked_element = linked_objects_index.get(downstream_element.guid)
+            if not linked_element:
+                linked_element = next(
+                    (
+                        unique_downstream_elements[linked_obj]
+                        for linked_obj in downstream_element.linked_objects
+                        if linked_obj in unique_downstream_elements
+                    ),
+                    None,
+                )
+
+            if linked_element:
+                model.linked_object_data_source_types[
+                    linked_element.guid
+                ] = downstream_element.data_source_type
+            else:
+                downstream_element = shared_elements.setdefault(
+                    downstream_element.guid, downstream_element
+                )
+                unique_downstream_elements[downstream_element.guid] = downstream_element
+
+        model.all_unique_downstream_elements = list(unique_downstream_elements.values())
+
+    def __get_lineage_pipelined(self, dbt_models: list[DbtModel]):
         """
-        Checks both the dbt model downstream list and their warehouse link downstream list for duplicates between them,
-         creating a single, unique, downstream.
+        Fetch the GUID, warehouse links and direct lineage of the dbt models as a pipeline over a single work queue.
+        As soon as the GUID of a model is resolved its warehouse links and lineage requests are queued, then the
+         lineage of its linked tables as soon as the tables are found. The linked tables and the lineage are still
+         requested in batches, sent when a batch is full or when a worker is idle.
+        Each model is deduplicated once all its inputs are fetched, in the models order, so the result is the same
+         as the sequential phases.
         :param dbt_models: list of dbt models
         """
+        # future -> callback receiving its result, callbacks only run in this thread
+        pending: dict[Future, Callable] = {}
+        # model -> warehouse links without their tables, once fetched
+        links_by_model: dict[DbtModel, list[WarehouseLink]] = {}
+        # table guid -> table data, None when the table was not found
+        found_tables: dict[str, dict | None] = {}
+        # guid of a requested lineage or table -> the models waiting for it
+        waiting_downstream: dict[str, list[DbtModel]] = {}
+        waiting_tables: dict[str, list[DbtModel]] = {}
+        # in column mode: table guid and columns -> the models waiting for their downstream, column guid -> the
+        #  tables columns waiting for its lineage
+        waiting_columns: dict[tuple[str, frozenset[str]], list[DbtModel]] = {}
+        waiting_column_lineage: dict[str, list[tuple[str, frozenset[str]]]] = {}
+        column_guids_by_key: dict[tuple[str, frozenset[str]], list[str]] = {}
+        # guids to be requested, sent in batches
+        tables_to_fetch: list[str] = []
+        lineage_to_fetch: list[str] = []
+        completed_models: set[DbtModel] = set()
+        shared_elements: dict[str, DownstreamElement] = {}
+        next_model = 0
+
+        def submit(callback: Callable, function: Callable, *args):
+            pending[executor.submit(function, *args)] = callback
+
+        def lookup_by_filename(models: list[DbtModel]):
+            for chunk in self.__chunk_models_by_filename(models):
+                submit(partial(on_guids, chunk), self.__get_chunk_guids, chunk)
+
+        def on_guids_by_name(chunk: list[DbtModel], _):
+            for model in chunk:
+                if model.guid:
+                    start(model)
+            # the models not found by name fall back to the filename lookup
+            lookup_by_filename([model for model in chunk if not model.guid])
+
+        def on_guids(chunk: list[DbtModel], _):
+            for model in chunk:
+                if model.guid:
+                    start(model)
+                else:
+                    complete(model)
+
+        def start(model: DbtModel):
+            submit(partial(on_links, model), self.__get_model_warehouse_links, model)
+            request_downstream(model, model.guid)
+
+        def request_downstream(model: DbtModel, guid: str):
+            if model.changed_columns is not None:
+                request_columns_downstream(model, (guid, model.changed_columns))
+                return
+            if guid in self.downstream_by_guid:
+                return
+            if guid not in waiting_downstream:
+                waiting_downstream[guid] = []
+                lineage_to_fetch.append(guid)
+            waiting_downstream[guid].append(model)
+
+        def on_downstream(
+            guids: list[str], downstream_by_guid: dict[str, list[DownstreamElement]]
+        ):
+            self.downstream_by_guid.update(downstream_by_guid)
+            for guid in guids:
+                for model in waiting_downstream.pop(guid):
+                    check(model)
+
+        def request_columns_downstream(
+            model: DbtModel, key: tuple[str, frozenset[str]]
+        ):
+            if key in self.columns_downstream:
+                return
+            if key in self.columns_not_found:
+                fall_back(model)
+                return
+            if key not in waiting_columns:
+                waiting_columns[key] = []
+                submit(partial(on_column_guids, key), self.__get_column_guids, *key)
+            waiting_columns[key].append(model)
+
+        def on_column_guids(
+            key: tuple[str, frozenset[str]], column_guids: list[str] | None
+        ):
+            if column_guids is None:
+                self.columns_not_found.add(key)
+                for model in waiting_columns.pop(key):
+                    fall_back(model)
+                return
+            column_guids_by_key[key] = column_guids
+            for column_guid in column_guids:
+                if column_guid in self.downstream_by_column:
+                    continue
+                if column_guid not in waiting_column_lineage:
+                    waiting_column_lineage[column_guid] = []
+                    submit(
+                        partial(on_column_downstream, column_guid),
+                        self.__get_column_downstream,
+                        column_guid,
+                    )
+                waiting_column_lineage[column_guid].append(key)
+            check_columns(key)
+
+        def on_column_downstream(column_guid: str, downstream: list[DownstreamElement]):
+            self.downstream_by_column[column_guid] = downstream
+            for key in waiting_column_lineage.pop(column_guid):
+                check_columns(key)
+
+        def check_columns(key: tuple[str, frozenset[str]]):
+            if key in column_guids_by_key and all(
+                column_guid in self.downstream_by_column
+                for column_guid in column_guids_by_key[key]
+            ):
+                self.columns_downstream[key] = self.__merge_columns_downstream(
+                    column_guids_by_key.pop(key)
+                )
+                for model in waiting_columns.pop(key):
+                    check(model)
+
+        def fall_back(model: DbtModel):
+            # a model waiting for several tables columns falls back once
+            if model.changed_columns is None:
+                return
+            self.__fall_back_to_table_lineage(model)
+            request_downstream(model, model.guid)
+            for link in links_by_model.get(model, []):
+                if found_tables.get(link.guid):
+                    request_downstream(model, link.guid)
+            check(model)
+
+        def on_links(model: DbtModel, links: list[WarehouseLink]):
+            links_by_model[model] = links
+            # the lineage of a linked table is requested once the table is found, as in the sequential phases
+            for link in links:
+                if link.guid in found_tables:
+                    if found_tables[link.guid]:
+                        request_downstream(model, link.guid)
+                    continue
+                if link.guid not in waiting_tables:
+                    waiting_tables[link.guid] = []
+                    tables_to_fetch.append(link.guid)
+                waiting_tables[link.guid].append(model)
+            check(model)
+
+        def on_tables(guids: list[str], tables: dict[str, dict]):
+            for guid in guids:
+                found_tables[guid] = tables.get(guid)
+                for model in waiting_tables.pop(guid):
+                    if found_tables[guid]:
+                        request_downstream(model, guid)
+                    check(model)
+
+        def flush():
+            while tables_to_fetch and (
+                len(tables_to_fetch) >= TABLES_CHUNK_SIZE
+                or len(pending) < self.max_concurrency
+            ):
+                guids = tables_to_fetch[:TABLES_CHUNK_SIZE]
+                del tables_to_fetch[:TABLES_CHUNK_SIZE]
+                log.info(f"  Fetching {len(guids)} warehouse linked tables")
+                submit(partial(on_tables, guids), self.__get_tables_chunk, guids)
+
+            batch_size = self.lineage_batch_size if self.lineage_batch_supported else 1
+            while lineage_to_fetch and (
+                len(lineage_to_fetch) >= batch_size
+                or len(pending) < self.max_concurrency
+            ):
+                guids = lineage_to_fetch[:batch_size]
+                del lineage_to_fetch[:batch_size]
+                for chunk in self.__chunk_lineage_guids(guids):
+                    submit(
+                        partial(on_downstream, chunk),
+                        self.__get_downstream_batch,
+                        chunk,
+                    )
+
+        def check(model: DbtModel):
+            links = links_by_model.get(model)
+            if (
+                links is not None
+                and self.__get_fetched_downstream(model, model.guid) is not None
+                and all(
+                    link.guid in found_tables
+                    # the links to a table not found are left out
+                    and (
+                        found_tables[link.guid] is None
+                        or self.__get_fetched_downstream(model, link.guid) is not None
+                    )
+                    for link in links
+                )
+            ):
+                complete(model)
+
+        def complete(model: DbtModel):
+            nonlocal next_model
+            completed_models.add(model)
+            # the first model reaching an element picks its shared instance, as in the sequential phases
+            while (
+                next_model < len(dbt_models)
+                and dbt_models[next_model] in completed_models
+            ):
+                completed_model = dbt_models[next_model]
+                if completed_model.guid:
+                    self.__set_warehouse_links(
+                        completed_model,
+                        links_by_model.pop(completed_model),
+                        found_tables,
+                    )
+                    self.__fill_downstream(completed_model)
+                self.__deduplicate_model_downstream(completed_model, shared_elements)
+                next_model += 1
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            for chunk in self.__chunk_models_by_name(
+                [model for model in dbt_models if model.full_name]
+            ):
+                submit(
+                    partial(on_guids_by_name, chunk),
+                    self.__get_chunk_guids_by_name,
+                    chunk,
+                )
+            lookup_by_filename([model for model in dbt_models if not model.full_name])
+
+            try:
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pending.pop(future)(future.result())
+                    flush()
+            except BaseException:
+                # the queued requests are dropped, only the running ones are awaited
+                for future in pending:
+                    future.cancel()
+                raise
+
+    def __get_transitive_lineage(self, dbt_models: list[DbtModel]):
+        """
+        Walk the downstream graph of each dbt model breadth-first, up to SELECTSTAR_LINEAGE_DEPTH levels.
+        The frontier of each level is fetched concurrently, visited GUIDs are not fetched again and the total number
+         of fetched nodes is capped by SELECTSTAR_LINEAGE_NODE_BUDGET.
+        :param dbt_models: list of dbt models, with their direct downstream already deduplicated
+        """
+        node_budget = self.lineage_node_budget
+
         for model in dbt_models:
-            # we merge the downstream elements from the dbt model and its warehouse link
-            all_downstream_elements = model.downstream_elements
-            if model.warehouse_links:
-                all_downstream_elements = (
-                    all_downstream_elements
-                    + model.warehouse_links[0].table.downstream_elements
-                )
-
-            # then we create a unique list of downstream elements
-            unique_downstream_elements = {}
-
-            # first we pick the dbt elements, they have priority over their links
-            for downstream_element in all_downstream_elements:
-                if (
-                    downstream_element.guid not in unique_downstream_elements
-                    and downstream_element.data_source_type == "dbt"
-                ):
-                    unique_downstream_elements[
-                        downstream_element.guid
-                    ] = downstream_element
-
-            # second we pick the other data source type elements and check if the linked object
-            # is already in the list previously populated by dbt elements
-            for downstream_element in all_downstream_elements:
-                if (
-                    downstream_element.guid not in unique_downstream_elements
-                    and downstream_element.data_source_type != "dbt"
-                ):
-                    is_unique = True
-                    for linked_obj in downstream_element.linked_objects:
-                        if linked_obj in unique_downstream_elements:
-                            unique_downstream_elements[
-                                linked_obj
-                            ].linked_object_data_source_type = (
-                                downstream_element.data_source_type
-                            )
-                            is_unique = False
-                            break
-                    if is_unique:
-                        unique_downstream_elements[
-                            downstream_element.guid
-                        ] = downstream_element
-
-            model.all_unique_downstream_elements = list(
-                unique_downstream_elements.values()
+            # the transitive lineage is table-level only
+            if not model.guid or model.changed_columns is not None:
+                continue
+
+            graph = LineageGraph()
+            visited = {model.guid} | {link.table.guid for link in model.warehouse_links}
+            frontier = model.all_unique_downstream_elements
+            for element in frontier:
+                visited.add(element.guid)
+                visited.update(element.linked_objects)
+            graph.edges[model.guid] = [element.guid for element in frontier]
+            if frontier:
+                graph.levels[1] = frontier
+
+            for depth in range(2, self.lineage_depth + 1):
+                to_fetch = list(
+                    {
+                        element.guid: None
+                        for element in frontier
+                        if element.guid not in self.downstream_by_guid
+                    }
+                )
+                if len(to_fetch) > node_budget:
+                    graph.truncated = True
+                    to_fetch = to_fetch[:node_budget]
+                node_budget -= self.__fetch_downstream(to_fetch)
+
+                next_frontier = []
+                for element in frontier:
+                    if element.guid not in self.downstream_by_guid:
+                        continue
+                    downstream = self.downstream_by_guid[element.guid]
+                    graph.edges[element.guid] = [child.guid for child in downstream]
+                    for child in downstream:
+                        if child.guid not in visited:
+                            visited.add(child.guid)
+                            visited.update(child.linked_objects)
+                            next_frontier.append(child)
+
+                if not next_frontier:
+                    break
+                graph.levels[depth] = next_frontier
+                frontier = next_frontier
+
+            model.lineage_graph = graph
+
+        if node_budget <= 0:
+            log.warning(
+                f" The lineage node budget ({self.lineage_node_budget}) was reached,"
+                " the transitive impact is incomplete."
             )
 
+    @staticmethod
+    def get_shared_downstream(
+        dbt_models: list[DbtModel],
+    ) -> list[SharedDownstreamElement]:
+        """
+        Build the index of the downstream elements affected by more than one of the given models
+        :param dbt_models: list of dbt models, with their lineage already fetched
+        :return: the shared elements, the ones affected by more models first
+        """
+        shared_elements: dict[str, SharedDownstreamElement] = {}
+        for model in dbt_models:
+            for element in model.all_unique_downstream_elements:
+                shared_elements.setdefault(
+                    element.guid, SharedDownstreamElement(element)
+                ).models.append(model)
+
+        return sorted(
+            (
+                shared_element
+                for shared_element in shared_elements.values()
+                if len(shared_element.models) > 1
+            ),
+            key=lambda shared_element: (
+                -len(shared_element.models),
+                shared_element.element.data_source_type or "",
+                shared_element.element.type or "",
+                shared_element.element.name or "",
+            ),
+        )
+
     def get_lineage(self, dbt_models: list[DbtModel]):
         """
         Fetch all the required data for the impact report
         :param dbt_models: list of the modified models
         :return: complete structure of models, tables and lineage
         """
-        log.info(" Fetching the dbt models GUID")
-        self.__get_tables_guids(dbt_models=dbt_models)
-        log.info(" Fetching the dbt models warehouse links")
-        self.__get_warehouse_links(dbt_models=dbt_models)
-        log.info(" Fetching the dbt models full lineage")
-        self.__get_full_lineage(dbt_models=dbt_models)
-        log.info(" Deduplicate the downstream elements")
-        self.__deduplicate_downstream(dbt_models=dbt_models)
+        if self.pipeline:
+            log.info(
+                " Fetching the dbt models GUID, warehouse links and full lineage as a pipeline"
+            )
+            with metrics.stage("get_lineage_pipeline"):
+                self.__get_lineage_pipelined(dbt_models=dbt_models)
+        else:
+            log.info(" Fetching the dbt models GUID")
+            with metrics.stage("get_tables_guids"):
+                self.__get_tables_guids(dbt_models=dbt_models)
+            log.info(" Fetching the dbt models warehouse links")
+            with metrics.stage("get_warehouse_links"):
+                self.__get_warehouse_links(dbt_models=dbt_models)
+            log.info(" Fetching the dbt models full lineage")
+            with metrics.stage("get_full_lineage"):
+                self.__get_full_lineage(dbt_models=dbt_models)
+            log.info(" Deduplicate the downstream elements")
+            with metrics.stage("deduplicate_downstream"):
+                self.__deduplicate_downstream(dbt_models=dbt_models)
+        if self.lineage_depth > 1:
+            log.info(
+                f" Fetching the transitive lineage up to depth {self.lineage_depth}"
+            )
+            with metrics.stage("get_transitive_lineage"):
+                self.__get_transitive_lineage(dbt_models=dbt_models)
         return dbt_models
+
+    @classmethod
+    def get_lineage_by_datasource(cls, settings: dict, dbt_models: list[DbtModel]):
+        """
+        Fetch the lineage of the models of every dbt project from the datasource of the project, see
+         SELECTSTAR_PROJECT_DATASOURCES. The datasources are fetched concurrently, sharing the response cache and the
+         SELECTSTAR_MAX_CONCURRENCY requests.
+        :param settings: the app settings
+        :param dbt_models: list of the modified models
+        """
+        models_by_datasource = partition_by_datasource(
+            dbt_models=dbt_models,
+            project_datasources=settings.get(
+                AppSettings.SELECTSTAR_PROJECT_DATASOURCES
+            ),
+            default_datasource_guid=settings.get(
+                AppSettings.SELECTSTAR_DATASOURCE_GUID
+            ),
+        )
+        if not models_by_datasource:
+            return
+        if len(models_by_datasource) > 1:
+            log.info(
+                f"Fetching the lineage from {len(models_by_datasource)} datasources:"
+                f" {({guid: len(models) for guid, models in models_by_datasource.items()})}"
+            )
+
+        max_concurrency = max(
+            settings.get(AppSettings.SELECTSTAR_MAX_CONCURRENCY)
+            // len(models_by_datasource),
+            1,
+        )
+        cache = ResponseCache.from_settings(settings)
+
+        def get_datasource_lineage(datasource_guid: str, models: list[DbtModel]):
+            selectstar = cls(
+                settings=settings
+                | {
+                    AppSettings.SELECTSTAR_DATASOURCE_GUID: datasource_guid,
+                    AppSettings.SELECTSTAR_MAX_CONCURRENCY: max_concurrency,
+                },
+                cache=cache,
+            )
+            try:
+                selectstar.get_lineage(dbt_models=models)
+            finally:
+                selectstar.close()
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(models_by_datasource)) as executor:
+                list(
+                    executor.map(
+                        get_datasource_lineage,
+                        models_by_datasource.keys(),
+                        models_by_datasource.values(),
+                    )
+                )
+        finally:
+            if cache:
+                cache.close()
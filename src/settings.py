@@ -1,6 +1,7 @@
 import json
 import logging
 import os
+import re
 from enum import Enum
 
 from dotenv import load_dotenv
@@ -9,20 +10,45 @@ log = logging.getLogger(__name__)
 
 
 class AppSettings(Enum):
-    def __new__(cls, value: str, printable: bool = False):
+    def __new__(cls, value: str, printable: bool = False, default: str = None):
         obj = object.__new__(cls)
         obj._value_ = value
         obj.printable = printable
+        obj.default = default
         return obj
 
     SELECTSTAR_API_URL = ("SELECTSTAR_API_URL", True)
     SELECTSTAR_WEB_URL = ("SELECTSTAR_WEB_URL", True)
     SELECTSTAR_API_TOKEN = ("SELECTSTAR_API_TOKEN", False)
     SELECTSTAR_DATASOURCE_GUID = ("SELECTSTAR_DATASOURCE_GUID", True)
+    SELECTSTAR_PROJECT_DATASOURCES = ("SELECTSTAR_PROJECT_DATASOURCES", True, "")
+    SELECTSTAR_MAX_CONCURRENCY = ("SELECTSTAR_MAX_CONCURRENCY", True, "8")
+    SELECTSTAR_LINEAGE_DEPTH = ("SELECTSTAR_LINEAGE_DEPTH", True, "1")
+    SELECTSTAR_LINEAGE_NODE_BUDGET = ("SELECTSTAR_LINEAGE_NODE_BUDGET", True, "1000")
+    SELECTSTAR_LINEAGE_MODE = ("SELECTSTAR_LINEAGE_MODE", True, "table")
+    SELECTSTAR_LINEAGE_BATCH_SIZE = ("SELECTSTAR_LINEAGE_BATCH_SIZE", True, "25")
+    SELECTSTAR_PIPELINE = ("SELECTSTAR_PIPELINE", True, "True")
+    REPORT_SHARED_DOWNSTREAM = ("REPORT_SHARED_DOWNSTREAM", True, "True")
+    REPORT_INCREMENTAL = ("REPORT_INCREMENTAL", True, "True")
+    HTTP_MAX_RETRIES = ("HTTP_MAX_RETRIES", True, "5")
+    HTTP_BACKOFF_FACTOR = ("HTTP_BACKOFF_FACTOR", True, "0.5")
+    HTTP_MAX_RETRY_WAIT = ("HTTP_MAX_RETRY_WAIT", True, "60")
+    HTTP_TIMEOUT = ("HTTP_TIMEOUT", True, "60")
+    METRICS_FILE = ("METRICS_FILE", True, "")
+    CACHE_DIR = ("CACHE_DIR", True, "")
+    DBT_MANIFEST_PATH = ("DBT_MANIFEST_PATH", True, "")
+    CACHE_TTL = ("CACHE_TTL", True, "86400")
+    CACHE_MAX_ENTRIES = ("CACHE_MAX_ENTRIES", True, "50000")
+    CACHE_REFRESH = ("CACHE_REFRESH", True, "False")
     GIT_PROVIDER = ("GIT_PROVIDER", True)
+    GIT_API_URL = ("GIT_API_URL", True, "https://api.github.com")
     GIT_CI = ("GIT_CI", True)
     GIT_REPOSITORY = ("GIT_REPOSITORY", True)
     GIT_REPOSITORY_TOKEN = ("GIT_REPOSITORY_TOKEN", False)
+    GIT_MAX_CONCURRENCY = ("GIT_MAX_CONCURRENCY", True, "4")
+    GIT_CHANGED_FILES_SOURCE = ("GIT_CHANGED_FILES_SOURCE", True, "api")
+    GIT_BASE_REF = ("GIT_BASE_REF", True, "")
+    GIT_HEAD_REF = ("GIT_HEAD_REF", True, "HEAD")
     PULL_REQUEST_ID = ("PULL_REQUEST_ID", True)
 
 
@@ -45,14 +71,97 @@ class SettingsManager:
             self.settings[AppSettings.SELECTSTAR_WEB_URL] = self.settings[
                 AppSettings.SELECTSTAR_WEB_URL
             ].rstrip("/")
+            self.settings[AppSettings.GIT_API_URL] = self.settings[
+                AppSettings.GIT_API_URL
+            ].rstrip("/")
+
+            self.settings[
+                AppSettings.SELECTSTAR_PROJECT_DATASOURCES
+            ] = self.__parse_project_datasources(
+                self.settings[AppSettings.SELECTSTAR_PROJECT_DATASOURCES]
+            )
+
+            self.settings[AppSettings.SELECTSTAR_MAX_CONCURRENCY] = max(
+                int(self.settings[AppSettings.SELECTSTAR_MAX_CONCURRENCY]), 1
+            )
+
+            self.settings[AppSettings.HTTP_MAX_RETRIES] = int(
+                self.settings[AppSettings.HTTP_MAX_RETRIES]
+            )
+            self.settings[AppSettings.HTTP_BACKOFF_FACTOR] = float(
+                self.settings[AppSettings.HTTP_BACKOFF_FACTOR]
+            )
+            self.settings[AppSettings.HTTP_MAX_RETRY_WAIT] = int(
+                self.settings[AppSettings.HTTP_MAX_RETRY_WAIT]
+            )
+            self.settings[AppSettings.HTTP_TIMEOUT] = int(
+                self.settings[AppSettings.HTTP_TIMEOUT]
+            )
+
+            self.__resolve_workspace_path(AppSettings.CACHE_DIR)
+            self.__resolve_workspace_path(AppSettings.METRICS_FILE)
+            self.__resolve_workspace_path(AppSettings.DBT_MANIFEST_PATH)
+            self.settings[AppSettings.SELECTSTAR_LINEAGE_DEPTH] = max(
+                int(self.settings[AppSettings.SELECTSTAR_LINEAGE_DEPTH]), 1
+            )
+            self.settings[AppSettings.SELECTSTAR_LINEAGE_NODE_BUDGET] = max(
+                int(self.settings[AppSettings.SELECTSTAR_LINEAGE_NODE_BUDGET]), 0
+            )
+            self.settings[AppSettings.SELECTSTAR_LINEAGE_BATCH_SIZE] = max(
+                int(self.settings[AppSettings.SELECTSTAR_LINEAGE_BATCH_SIZE]), 1
+            )
+            self.settings[AppSettings.CACHE_TTL] = int(
+                self.settings[AppSettings.CACHE_TTL]
+            )
+            self.settings[AppSettings.CACHE_MAX_ENTRIES] = int(
+                self.settings[AppSettings.CACHE_MAX_ENTRIES]
+            )
+            self.settings[AppSettings.CACHE_REFRESH] = self.settings.get(
+                AppSettings.CACHE_REFRESH
+            ) in ["true", "True"]
+
+            self.settings[AppSettings.SELECTSTAR_PIPELINE] = self.settings.get(
+                AppSettings.SELECTSTAR_PIPELINE
+            ) not in ["false", "False"]
+
+            self.settings[AppSettings.REPORT_SHARED_DOWNSTREAM] = self.settings.get(
+                AppSettings.REPORT_SHARED_DOWNSTREAM
+            ) not in ["false", "False"]
+
+            self.settings[AppSettings.REPORT_INCREMENTAL] = self.settings.get(
+                AppSettings.REPORT_INCREMENTAL
+            ) not in ["false", "False"]
+
+            self.settings[AppSettings.GIT_MAX_CONCURRENCY] = max(
+                int(self.settings[AppSettings.GIT_MAX_CONCURRENCY]), 1
+            )
 
             self.settings[AppSettings.GIT_CI] = self.settings.get(
                 AppSettings.GIT_CI
             ) not in ["false", "False"]
 
+            if self.settings[AppSettings.GIT_CHANGED_FILES_SOURCE] not in [
+                "api",
+                "local",
+            ]:
+                raise KeyError(
+                    f"Unknown changed files source: {self.settings[AppSettings.GIT_CHANGED_FILES_SOURCE]}"
+                )
+
+            if self.settings[AppSettings.SELECTSTAR_LINEAGE_MODE] not in [
+                "table",
+                "column",
+            ]:
+                raise KeyError(
+                    f"Unknown lineage mode: {self.settings[AppSettings.SELECTSTAR_LINEAGE_MODE]}"
+                )
+
             if self.settings.get(AppSettings.GIT_CI):
                 if self.settings[AppSettings.GIT_PROVIDER] == "github":
-                    self.settings = self.settings | self.__get_settings_from_github()
+                    github_settings = self.__get_settings_from_github()
+                    if self.settings[AppSettings.GIT_BASE_REF]:
+                        github_settings.pop(AppSettings.GIT_BASE_REF, None)
+                    self.settings = self.settings | github_settings
                 else:
                     raise KeyError(
                         f"Unknown git provider: {self.settings[AppSettings.GIT_PROVIDER]}"
@@ -64,7 +173,36 @@ class SettingsManager:
 
     @staticmethod
     def __get_setting_from_environ(setting: AppSettings):
-        return os.environ.get(setting.value) or os.environ.get(f"INPUT_{setting.value}")
+        return (
+            os.environ.get(setting.value)
+            or os.environ.get(f"INPUT_{setting.value}")
+            or setting.default
+        )
+
+    @staticmethod
+    def __parse_project_datasources(value: str) -> dict[str, str]:
+        """
+        Parse the dbt projects datasources, e.g. "projects/finance=ds_guid_1,projects/marketing=ds_guid_2"
+        :param value: the project root and datasource GUID pairs, separated by commas or new lines
+        :return: the datasource GUID by project root
+        """
+        project_datasources = {}
+        for entry in re.split(r"[,\n]", value):
+            if not entry.strip():
+                continue
+            project_root, separator, datasource_guid = entry.partition("=")
+            if not separator or not datasource_guid.strip():
+                raise KeyError(f"Invalid project datasource: {entry.strip()}")
+            project_datasources[project_root.strip()] = datasource_guid.strip()
+
+        return project_datasources
+
+    def __resolve_workspace_path(self, setting: AppSettings):
+        # inside a docker action only the workspace is shared with the next steps, e.g. actions/cache
+        if self.settings[setting] and os.environ.get("GITHUB_WORKSPACE"):
+            self.settings[setting] = os.path.join(
+                os.environ["GITHUB_WORKSPACE"], self.settings[setting]
+            )
 
     @staticmethod
     def __get_settings_from_github() -> dict[AppSettings:str]:
@@ -78,6 +216,10 @@ class SettingsManager:
                     "full_name"
                 ]
                 git_settings[AppSettings.PULL_REQUEST_ID] = git_env["number"]
+                if "pull_request" in git_env:
+                    git_settings[AppSettings.GIT_BASE_REF] = git_env["pull_request"][
+                        "base"
+                    ]["sha"]
             return git_settings
         except Exception as exc:
             raise Exception(
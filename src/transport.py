@@ -0,0 +1,216 @@
+import logging
+import random
+import re
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+
+from metrics import metrics
+from settings import AppSettings
+
+log = logging.getLogger(__name__)
+
+GUID_SEGMENT = re.compile(r"^[a-z0-9]+_[A-Za-z0-9]{10,}$")
+# the encodings urllib3 can decode: gzip and deflate, plus brotli when the Brotli package is installed
+ACCEPT_ENCODING = make_headers(accept_encoding=True)["accept-encoding"]
+
+
+def endpoint_template(url: str) -> str:
+    """
+    Get the endpoint of the given URL with its identifiers replaced by placeholders,
+     e.g. https://api.github.com/repos/owner/repo/issues/12/comments -> api.github.com/repos/{owner}/{repo}/issues/{id}/comments
+    :param url: a request URL
+    :return: the endpoint template
+    """
+    parsed_url = urlparse(url)
+    segments = parsed_url.path.strip("/").split("/")
+    for idx, segment in enumerate(segments):
+        if idx > 0 and segments[idx - 1] == "repos" and idx + 1 < len(segments):
+            segments[idx] = "{owner}"
+            segments[idx + 1] = "{repo}"
+        elif segment.isdigit():
+            segments[idx] = "{id}"
+        elif GUID_SEGMENT.match(segment):
+            segments[idx] = "{guid}"
+
+    return f"{parsed_url.netloc}/{'/'.join(segments)}"
+
+
+class RetrySession(requests.Session):
+    """
+    HTTP session shared by the Git and Select Star interfaces.
+    Failed idempotent requests are retried with a jittered exponential backoff, honoring Retry-After and the GitHub
+     rate limit headers. Every request is recorded in the run metrics.
+    """
+
+    idempotent_methods = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+    retry_status_codes = {429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        pool_size: int,
+        max_retries: int,
+        backoff_factor: float,
+        max_wait: int,
+        timeout: int,
+    ):
+        super().__init__()
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_wait = max_wait
+        self.timeout = timeout
+        # epoch time until which the rate limit is exhausted
+        self._rate_limited_until = 0.0
+
+        # one pooled connection per worker, so concurrent requests don't discard connections
+        adapter = HTTPAdapter(pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method: str, url: str, *args, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        endpoint = endpoint_template(url)
+        attempt = 0
+
+        while True:
+            self.__wait_for_rate_limit()
+
+            start = time.monotonic()
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                metrics.record_request(
+                    endpoint, time.monotonic() - start, 0, is_retry=attempt > 0
+                )
+                if (
+                    method.upper() not in self.idempotent_methods
+                    or attempt >= self.max_retries
+                ):
+                    raise
+                delay = self.__get_backoff(attempt)
+                reason = repr(exc)
+            else:
+                # a streamed body isn't read yet, its size is recorded by StreamedBody
+                stream = kwargs.get("stream", False)
+                metrics.record_request(
+                    endpoint,
+                    time.monotonic() - start,
+                    0 if stream else response.raw.tell(),
+                    decoded_size=0 if stream else len(response.content),
+                    is_retry=attempt > 0,
+                )
+                self.__update_rate_limit(response)
+                if not self.__should_retry(method, response, attempt):
+                    return response
+                delay = self.__get_retry_delay(response, attempt)
+                reason = f"status code {response.status_code}"
+                # releases the connection of a streamed body, which is never read
+                response.close()
+
+            attempt += 1
+            log.warning(
+                f"Request to {endpoint} failed with {reason},"
+                f" retrying in {delay:.1f}s (attempt {attempt}/{self.max_retries})."
+            )
+            time.sleep(delay)
+
+    def __should_retry(
+        self, method: str, response: requests.Response, attempt: int
+    ) -> bool:
+        if attempt >= self.max_retries:
+            return False
+
+        # a rate limited request was not processed, it is safe to retry it whatever its method
+        if response.status_code == 429 or self.__is_rate_limited(response):
+            return True
+
+        return (
+            method.upper() in self.idempotent_methods
+            and response.status_code in self.retry_status_codes
+        )
+
+    @staticmethod
+    def __is_rate_limited(response: requests.Response) -> bool:
+        return response.status_code == 403 and (
+            "Retry-After" in response.headers
+            or response.headers.get("X-RateLimit-Remaining") == "0"
+        )
+
+    def __get_retry_delay(self, response: requests.Response, attempt: int) -> float:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_wait)
+
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            reset = response.headers.get("X-RateLimit-Reset")
+            if reset and reset.isdigit():
+                return min(max(float(reset) - time.time(), 0) + 1, self.max_wait)
+
+        return self.__get_backoff(attempt)
+
+    def __get_backoff(self, attempt: int) -> float:
+        # "full jitter" exponential backoff
+        return random.uniform(0, min(self.backoff_factor * 2**attempt, self.max_wait))
+
+    def __update_rate_limit(self, response: requests.Response):
+        reset = response.headers.get("X-RateLimit-Reset")
+        if (
+            response.headers.get("X-RateLimit-Remaining") == "0"
+            and reset
+            and reset.isdigit()
+        ):
+            self._rate_limited_until = float(reset)
+
+    def __wait_for_rate_limit(self):
+        wait = self._rate_limited_until - time.time()
+        if wait > 0:
+            wait = min(wait + 1, self.max_wait)
+            log.warning(f"The API rate limit is exhausted, waiting {wait:.1f}s.")
+            time.sleep(wait)
+            self._rate_limited_until = 0.0
+
+
+class StreamedBody:
+    """
+    The decoded body of a streamed response, read as a file.
+    Its transferred and decoded sizes are recorded in the run metrics once it is fully read.
+    """
+
+    def __init__(self, response: requests.Response):
+        self.raw = response.raw
+        self.endpoint = endpoint_template(response.url)
+        self.decoded_size = 0
+        self.recorded = False
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.raw.read(None if size < 0 else size, decode_content=True)
+        self.decoded_size += len(chunk)
+        # an empty read of a non-empty size is the end of the body
+        if not chunk and size != 0 and not self.recorded:
+            self.recorded = True
+            metrics.record_transfer(self.endpoint, self.raw.tell(), self.decoded_size)
+        return chunk
+
+
+def build_session(settings: dict, pool_size: int, headers: dict) -> RetrySession:
+    """
+    Creates an HTTP session configured by the app settings
+    :param settings: the app settings
+    :param pool_size: the number of pooled connections, matching the number of concurrent requests
+    :param headers: the headers sent with every request
+    :return: the session
+    """
+    session = RetrySession(
+        pool_size=pool_size,
+        max_retries=settings.get(AppSettings.HTTP_MAX_RETRIES),
+        backoff_factor=settings.get(AppSettings.HTTP_BACKOFF_FACTOR),
+        max_wait=settings.get(AppSettings.HTTP_MAX_RETRY_WAIT),
+        timeout=settings.get(AppSettings.HTTP_TIMEOUT),
+    )
+    # compressed responses, JSON bodies shrink several times
+    session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    session.headers.update(headers)
+    return session